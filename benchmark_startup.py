@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准测试
+
+分两部分测量服务器的冷启动开销：
+1. 分阶段耗时：在全新的子进程中依次计时 MCP 框架导入、state 初始化、工具模块导入和 list_tools；
+2. 端到端耗时：通过 stdio 启动 `python -m pixiv_mcp_server`，测量从进程启动到 initialize 响应、
+   以及 tools/list 请求到响应的时间。
+
+用法: python benchmark_startup.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 在子进程中执行，保证每次都是冷启动
+_BREAKDOWN_SCRIPT = r"""
+import asyncio, json, sys, time
+sys.path.insert(0, sys.argv[1])
+timings = {}
+start = time.perf_counter()
+t = start
+import mcp.server.fastmcp
+timings['import mcp'] = time.perf_counter() - t
+t = time.perf_counter()
+from pixiv_mcp_server.state import state
+timings['import state (PixivState 初始化)'] = time.perf_counter() - t
+t = time.perf_counter()
+from pixiv_mcp_server.tools import mcp
+timings['import tools (注册工具)'] = time.perf_counter() - t
+t = time.perf_counter()
+tools = asyncio.run(mcp.list_tools())
+timings['list_tools'] = time.perf_counter() - t
+timings['合计'] = time.perf_counter() - start
+timings['pixivpy3 已导入'] = 'pixivpy3' in sys.modules
+timings['aiohttp 已导入'] = 'aiohttp' in sys.modules
+print(json.dumps(timings))
+"""
+
+def _send(proc, message):
+    proc.stdin.write((json.dumps(message) + "\n").encode('utf-8'))
+    proc.stdin.flush()
+
+def _read_response(proc, request_id):
+    while True:
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError("服务器提前退出")
+        message = json.loads(line)
+        if message.get('id') == request_id:
+            return message
+
+def measure_breakdown():
+    output = subprocess.run(
+        [sys.executable, '-c', _BREAKDOWN_SCRIPT, ROOT],
+        capture_output=True, check=True, text=True, encoding='utf-8'
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_end_to_end():
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'pixiv_mcp_server'],
+        cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    try:
+        _send(proc, {
+            'jsonrpc': '2.0', 'id': 1, 'method': 'initialize',
+            'params': {
+                'protocolVersion': '2024-11-05',
+                'capabilities': {},
+                'clientInfo': {'name': 'benchmark', 'version': '1.0'},
+            },
+        })
+        _read_response(proc, 1)
+        initialized = time.perf_counter() - start
+        _send(proc, {'jsonrpc': '2.0', 'method': 'notifications/initialized'})
+
+        t = time.perf_counter()
+        _send(proc, {'jsonrpc': '2.0', 'id': 2, 'method': 'tools/list'})
+        _read_response(proc, 2)
+        list_tools = time.perf_counter() - t
+        return initialized, list_tools
+    finally:
+        proc.stdin.close()
+        proc.terminate()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="测量 Pixiv MCP 服务器的启动耗时")
+    parser.add_argument('--runs', type=int, default=5, help="重复次数，取中位数 (默认 5)")
+    args = parser.parse_args()
+
+    print(f"=== 分阶段耗时 (中位数, {args.runs} 次) ===")
+    runs = [measure_breakdown() for _ in range(args.runs)]
+    for key, value in runs[0].items():
+        if isinstance(value, bool):
+            print(f"  {key}: {'是' if value else '否'}")
+        else:
+            print(f"  {key}: {statistics.median(run[key] for run in runs) * 1000:.1f} ms")
+
+    print(f"\n=== 端到端 (stdio, 中位数, {args.runs} 次) ===")
+    results = [measure_end_to_end() for _ in range(args.runs)]
+    initialized = statistics.median(r[0] for r in results) * 1000
+    list_tools = statistics.median(r[1] for r in results) * 1000
+    print(f"  进程启动 -> initialize 响应: {initialized:.1f} ms")
+    print(f"  tools/list 请求 -> 响应: {list_tools:.1f} ms")
+    print(f"  tools/list 是否低于 100 ms: {'是' if list_tools < 100 else '否'}")
+
+if __name__ == "__main__":
+    main()
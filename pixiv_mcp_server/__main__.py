@@ -1,6 +1,5 @@
 import logging
 import os
-import urllib3
 from dotenv import load_dotenv
 
 def setup_environment():
@@ -34,29 +33,21 @@ def main():
     setup_environment()
     
     from .state import state
-    from .downloader import HAS_FFMPEG
     from .tools import mcp
 
     # 步骤 3: 初始化应用
     os.makedirs(state.download_path, exist_ok=True)
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
     logger.info("Pixiv MCP 服务器启动中...")
     logger.info(f"默认下载路径: {state.download_path}")
     logger.info(f"文件名模板: {state.filename_template}")
-    logger.info(f"FFmpeg支持: {'是' if HAS_FFMPEG else '否'}")
 
-    # 步骤 4: 自动认证
+    # 步骤 4: 认证。优先复用磁盘上仍有效的 access token；否则推迟到首次需要认证的工具调用，不阻塞启动
     if state.refresh_token:
-        logger.info("正在尝试使用环境变量中的 PIXIV_REFRESH_TOKEN 自动认证...")
-        try:
-            state.api.auth(refresh_token=state.refresh_token)
-            state.is_authenticated = True
-            state.user_id = state.api.user_id
-            logger.info(f"自动认证成功，用户ID: {state.user_id}")
-        except Exception as e:
-            logger.warning(f"自动认证失败: {e}")
-            logger.warning("请检查您的 REFRESH_TOKEN 是否有效或网络连接/代理设置是否正确。")
+        if state.token_manager.load_cached():
+            logger.info(f"已复用缓存的 access token，用户ID: {state.user_id}")
+        else:
+            logger.info("将在首次调用 Pixiv API 时使用 PIXIV_REFRESH_TOKEN 自动认证。")
     else:
         logger.info("未找到 PIXIV_REFRESH_TOKEN，需要手动使用 auth 工具进行认证。")
 
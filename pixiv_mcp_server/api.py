@@ -0,0 +1,80 @@
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .cache import cache_key, normalize_args
+from .retry import classify_response
+from .state import state
+
+# pixivpy 的所有数据接口都访问此主机
+PIXIV_API_HOST = 'app-api.pixiv.net'
+
+async def call_api(method: str, *args: Any, **kwargs: Any) -> Any:
+    """所有 Pixiv API 调用的统一入口。
+
+    可缓存的只读接口先查 state.api_cache，再查持久化的 state.metadata_store（命中后回填内存缓存），命中时不发起请求；
+    成功的响应写入两级缓存，列表结果中的完整作品信息会预填 illust_detail 缓存。
+    两级缓存各自独立开关：API_CACHE_SIZE=0 只关闭内存缓存，持久化缓存仍然生效。
+    缓存未命中时，参数相同的并发调用经 state.singleflight 合并为一次请求。
+    每次尝试先确认 access token 有效（即将过期时等待共享的刷新），再从 app-api.pixiv.net 的令牌桶取得配额，
+    然后在元数据线程池 state.metadata_executor 中执行同步的 pixivpy 方法 state.api.<method>。
+    限流和临时错误按 state.retry_policy 退避重试，token 失效时刷新后重试一次。
+    重试耗尽后返回最后一次的错误 JSON（或抛出最后一次的异常），调用方按原有方式处理。
+    """
+    client = await state.get_api()
+    func = getattr(client, method)
+    cache = state.api_cache
+    store = state.metadata_store
+    in_memory = cache.cacheable(method)
+    if not in_memory and not store.persistable(method):
+        return await _fetch(method, func, args, kwargs)
+
+    arguments = normalize_args(func, args, kwargs)
+    key = cache_key(method, arguments)
+    if in_memory:
+        cached = cache.get(method, key)
+        if cached is not None:
+            return cached
+
+    async def load():
+        if store.persistable(method):
+            stored = await state.metadata_executor.run(store.get, key)
+            if stored is not None:
+                value, expires_at = stored
+                if in_memory:
+                    cache.put(method, key, value, None if expires_at is None else expires_at - time.time())
+                return value
+        return await _fetch(method, func, args, kwargs, key, arguments)
+
+    # 相同的并发只读请求共享同一次加载
+    return await state.singleflight.run(method, key, load)
+
+async def _fetch(method: str, func: Callable, args: Tuple, kwargs: Dict[str, Any],
+                 key: Optional[str] = None, arguments: Optional[Dict[str, Any]] = None) -> Any:
+    """发起请求并将成功的响应写入两级缓存。"""
+    cache = state.api_cache
+    store = state.metadata_store
+
+    async def attempt():
+        await state.token_manager.ensure_valid()
+        await state.rate_limiter.acquire(PIXIV_API_HOST, 'requests')
+        return await state.metadata_executor.run(func, *args, **kwargs)
+
+    result = await state.retry_policy.run(
+        attempt, f"API {method}", classify_result=classify_response, on_auth=state.token_manager.refresh
+    )
+    if classify_response(result) is None:
+        now = time.time()
+        rows = []
+        if key is not None:
+            ttl = cache.ttl_for(method, arguments)
+            if cache.cacheable(method):
+                cache.put(method, key, result, ttl)
+            rows.append((method, key, result, None if ttl is None else now + ttl))
+        detail_expires_at = now + cache.ttls.get('illust_detail', 0)
+        for seeded_key, value in cache.seed_details(result, state.api.illust_detail,
+                                                      persist=store.persistable('illust_detail')):
+            rows.append(('illust_detail', seeded_key, value, detail_expires_at))
+        rows = [row for row in rows if store.persistable(row[0])]
+        if rows:
+            await state.metadata_executor.run(store.put_many, rows)
+    return result
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger('pixiv-mcp-server')
+
+class TokenManager:
+    """OAuth access token 管理器。
+
+    - 记录 auth 响应中的 expires_in，由后台任务在过期前 refresh_margin 秒主动刷新；
+    - 并发的刷新请求合并为同一个在途请求（single-flight），所有调用方等待同一结果；
+    - ensure_valid 在 token 仍有效时不发起任何网络请求，可在每次 API 调用前廉价调用；
+    - 提供 cache_path 时，access token、过期时间和用户 ID 以仅属主可读写 (0600) 的文件保存，
+      重启后若仍有效则直接复用，无需等待 OAuth 请求。
+    """
+    def __init__(self, state, refresh_margin: float = 300.0, retry_interval: float = 60.0,
+                 cache_path: Optional[str] = None):
+        self._state = state
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        # access token 的过期时间（Unix 时间戳）；未知时为 None
+        self.expires_at: Optional[float] = None
+        self.refresh_count = 0
+        # 从磁盘恢复、尚未交给 API 客户端的 (access_token, user_id)，见 bind
+        self._restored: Optional[Tuple[str, Optional[int]]] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._background: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        """已认证且 access token 距过期还有 refresh_margin 以上。过期时间未知时视为有效。"""
+        if not self._state.is_authenticated:
+            return False
+        return self.expires_at is None or time.time() < self.expires_at - self.refresh_margin
+
+    def apply(self, token: Dict[str, Any]):
+        """记录 auth 响应：认证状态、用户 ID、过期时间，以及服务器轮换后的 refresh token。"""
+        state = self._state
+        state.is_authenticated = True
+        state.user_id = state.api.user_id
+        self._restored = None
+        expires_in = token.get('expires_in')
+        self.expires_at = time.time() + float(expires_in) if expires_in else None
+        if token.get('refresh_token'):
+            state.refresh_token = token['refresh_token']
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @staticmethod
+    def _fingerprint(refresh_token: str) -> str:
+        # 缓存只保存 refresh token 的摘要，用于判断缓存是否属于当前配置的账号
+        return hashlib.sha256(refresh_token.encode('utf-8')).hexdigest()
+
+    def load_cached(self) -> bool:
+        """从磁盘恢复仍有效的 access token。成功时返回 True，否则保持未认证状态等待首次调用时认证。
+
+        只记录 token，不创建 API 客户端（导入 pixivpy 约需上百毫秒），客户端首次创建时由 bind 设置。
+        """
+        state = self._state
+        if not self.cache_path or not state.refresh_token or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取 token 缓存失败: {e}")
+            return False
+        if cached.get('refresh_token_sha256') != self._fingerprint(state.refresh_token):
+            return False
+        if time.time() >= cached.get('expires_at', 0) - self.refresh_margin:
+            return False
+        self._restored = (cached['access_token'], cached.get('user_id'))
+        state.user_id = cached.get('user_id')
+        state.is_authenticated = True
+        self.expires_at = cached['expires_at']
+        return True
+
+    def bind(self, client):
+        """API 客户端创建时调用：把从磁盘恢复的 token 设置到客户端上。"""
+        if self._restored is not None:
+            access_token, user_id = self._restored
+            client.set_auth(access_token, self._state.refresh_token)
+            client.user_id = user_id
+            self._restored = None
+
+    def _save(self, source_refresh_token: str):
+        """写入 token 缓存：先写临时文件（创建时即为 0600），再原子替换。"""
+        if not self.cache_path or self.expires_at is None:
+            return
+        state = self._state
+        payload = {
+            'access_token': state.api.access_token,
+            'expires_at': self.expires_at,
+            'user_id': state.user_id,
+            'refresh_token_sha256': self._fingerprint(source_refresh_token),
+        }
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(payload, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"保存 token 缓存失败: {e}")
+
+    async def ensure_valid(self) -> bool:
+        """token 有效时立即返回 True；否则（有 refresh token 时）等待一次共享的刷新。"""
+        if self.is_fresh:
+            return True
+        if not self._state.refresh_token:
+            return False
+        return await self.refresh()
+
+    async def refresh(self) -> bool:
+        """刷新 access token，返回是否成功。已有刷新在进行时等待其结果而不重复请求。"""
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._do_refresh())
+            self._inflight.add_done_callback(self._clear_inflight)
+        # shield：单个调用方被取消不影响其他等待者
+        return await asyncio.shield(self._inflight)
+
+    def _clear_inflight(self, _future: asyncio.Future):
+        self._inflight = None
+
+    async def _do_refresh(self) -> bool:
+        state = self._state
+        if not state.refresh_token:
+            logger.error("无法刷新token：未找到refresh_token")
+            return False
+        try:
+            logger.info("正在刷新 access token...")
+            client = await state.get_api()
+            token = await state.metadata_executor.run(client.auth, refresh_token=state.refresh_token)
+        except Exception as e:
+            logger.error(f"Token刷新过程中发生异常: {e}")
+            return False
+        if not token or 'access_token' not in token:
+            logger.error(f"Token刷新失败: {token}")
+            return False
+        source_refresh_token = state.refresh_token
+        self.apply(token)
+        await state.io_executor.run(self._save, source_refresh_token)
+        self.refresh_count += 1
+        logger.info(f"Token刷新成功，有效期 {token.get('expires_in', '未知')} 秒")
+        return True
+
+    async def start(self):
+        """启动后台主动刷新任务。"""
+        if self._background is None:
+            self._wakeup = asyncio.Event()
+            self._background = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._background is not None:
+            self._background.cancel()
+            await asyncio.gather(self._background, return_exceptions=True)
+            self._background = None
+
+    async def _refresh_loop(self):
+        while True:
+            self._wakeup.clear()
+            if self.expires_at is None or not self._state.refresh_token:
+                # 尚未认证或过期时间未知：等到下一次认证成功后再排期
+                await self._wakeup.wait()
+                continue
+            delay = self.expires_at - self.refresh_margin - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    # 期间有其他途径完成了认证，按新的过期时间重新排期
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            if not await self.refresh():
+                await asyncio.sleep(self.retry_interval)
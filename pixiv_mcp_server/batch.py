@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .api import call_api
+from .output import render_list
+from .state import state
+from .utils import format_illust_summary, handle_api_error, validate_output_options
+
+logger = logging.getLogger('pixiv-mcp-server')
+
+async def fetch_illust_details(illust_ids: Sequence[int]) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+    """批量获取作品详情，返回 (按输入顺序排列的作品列表, [(ID, 错误信息)])。
+
+    重复的 ID 只请求一次。每个 ID 都经过 call_api：已在内存缓存或本地元数据库中的直接返回，不占用请求配额；
+    其余同时发出，实际并发和速率由元数据线程池与 app-api 令牌桶限制。单个 ID 失败不影响其他 ID。
+    """
+    unique_ids = list(dict.fromkeys(illust_ids))
+    responses = await asyncio.gather(*(call_api('illust_detail', illust_id) for illust_id in unique_ids),
+                                     return_exceptions=True)
+    illusts, errors = [], []
+    for illust_id, response in zip(unique_ids, responses):
+        if isinstance(response, BaseException):
+            logger.warning(f"批量获取作品详情 {illust_id} 失败: {response}")
+            errors.append((illust_id, str(response) or type(response).__name__))
+            continue
+        error = handle_api_error(response)
+        if error is None and not response.get('illust'):
+            error = "响应中没有作品信息。"
+        if error:
+            errors.append((illust_id, error))
+        else:
+            illusts.append(response['illust'])
+    return illusts, errors
+
+async def render_illust_details(illust_ids: Sequence[int], output_mode: Optional[str] = None, fields: Optional[str] = None,
+                                max_items: Optional[int] = None, max_chars: Optional[int] = None,
+                                separator: str = "\n\n") -> str:
+    """illust_detail_batch 工具的实现，供 FastMCP 与 DXT 两个入口共用。
+
+    工具参数和 OUTPUT_MODE 都未指定输出模式时默认使用 compact（每个作品一行），失败的 ID 附在结果末尾。
+    """
+    if not illust_ids:
+        return "错误：illust_ids 不能为空。"
+    if len(illust_ids) > state.batch_max_ids:
+        return f"错误：单次最多查询 {state.batch_max_ids} 个作品，当前为 {len(illust_ids)} 个。"
+    error = validate_output_options(output_mode, fields)
+    if error:
+        return error
+
+    illusts, errors = await fetch_illust_details(illust_ids)
+    footer = ""
+    if errors:
+        footer = "\n\n获取失败:\n" + "\n".join(f"- {illust_id}: {message}" for illust_id, message in errors)
+    return render_list(illusts, 'illust_detail', format_illust_summary,
+                       f"获取到 {len(illusts)} 个作品的详情，{len(errors)} 个失败:\n\n",
+                       output_mode or (None if state.output_mode_configured else 'compact'), fields,
+                       separator=separator, max_items=max_items, max_chars=max_chars, footer=footer,
+                       meta={'errors': [{'id': illust_id, 'error': message} for illust_id, message in errors]})
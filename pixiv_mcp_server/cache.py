@@ -0,0 +1,123 @@
+import datetime
+import functools
+import inspect
+import json
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 各接口的缓存有效期（秒）。未列出的接口（推荐、关注动态、收藏等个性化内容）不缓存
+DEFAULT_TTLS: Dict[str, float] = {
+    'illust_detail': 3600,
+    'ugoira_metadata': 86400,
+    'illust_related': 1800,
+    'illust_ranking': 600,
+    'trending_tags_illust': 600,
+    'search_illust': 300,
+    'search_user': 600,
+    'user_detail': 3600,
+}
+
+@functools.lru_cache(maxsize=None)
+def _signature(func: Callable) -> inspect.Signature:
+    return inspect.signature(func)
+
+def normalize_args(func: Callable, args: Tuple, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """将调用参数按方法签名绑定并补全默认值，使位置参数与关键字参数写法得到相同的键。"""
+    try:
+        bound = _signature(func).bind(*args, **kwargs)
+    except (TypeError, ValueError):
+        # 无法绑定时退回原始参数
+        return {'args': list(args), **kwargs}
+    bound.apply_defaults()
+    return dict(bound.arguments)
+
+def cache_key(method: str, arguments: Dict[str, Any]) -> str:
+    return method + ':' + json.dumps(arguments, sort_keys=True, default=str, ensure_ascii=False)
+
+def _is_past_ranking(arguments: Dict[str, Any]) -> bool:
+    """指定了过去日期的排行榜不会再变化。留出一天余量以覆盖时区差异。"""
+    date = arguments.get('date')
+    if not date:
+        return False
+    try:
+        day = datetime.date.fromisoformat(str(date))
+    except ValueError:
+        return False
+    return day < datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=1)
+
+class ResponseCache:
+    """Pixiv API 响应的内存缓存：按接口设置 TTL，超过 max_entries 时按 LRU 淘汰。
+
+    键为方法名加按签名规范化后的参数。只缓存成功的响应；hits/misses 按方法统计。
+    """
+    def __init__(self, max_entries: int = 1024, ttls: Optional[Dict[str, float]] = None):
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        # key -> (过期时间戳或 None, 响应)
+        self._entries: 'OrderedDict[str, Tuple[Optional[float], Any]]' = OrderedDict()
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.seeded = 0
+        self.evictions = 0
+
+    def cacheable(self, method: str) -> bool:
+        return self.max_entries > 0 and method in self.ttls
+
+    def ttl_for(self, method: str, arguments: Dict[str, Any]) -> Optional[float]:
+        """返回条目的有效期，None 表示永不过期（仍可能被 LRU 淘汰）。"""
+        if method == 'illust_ranking' and _is_past_ranking(arguments):
+            return None
+        return self.ttls[method]
+
+    def get(self, method: str, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or time.time() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits[method] += 1
+                return value
+            del self._entries[key]
+        self.misses[method] += 1
+        return None
+
+    def put(self, method: str, key: str, value: Any, ttl: Optional[float]):
+        self._entries[key] = (None if ttl is None else time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def seed_details(self, response: Any, detail_func: Callable, persist: bool = False) -> List[Tuple[str, Any]]:
+        """用列表接口（搜索、排行榜、相关作品等）返回的完整作品信息预填 illust_detail 缓存。
+
+        返回新预填条目的 (key, 响应) 列表，供持久化缓存一并写入。persist 为 True 时即使内存缓存关闭
+        （API_CACHE_SIZE=0）也生成这些条目。
+        """
+        in_memory = self.cacheable('illust_detail')
+        if not (in_memory or persist) or not isinstance(response, dict):
+            return []
+        illusts = response.get('illusts')
+        if not isinstance(illusts, list):
+            return []
+        seeded = []
+        for illust in illusts:
+            if not isinstance(illust, dict) or 'id' not in illust:
+                continue
+            arguments = normalize_args(detail_func, (illust['id'],), {})
+            key = cache_key('illust_detail', arguments)
+            if in_memory and key in self._entries:
+                continue
+            value = {'illust': illust}
+            if in_memory:
+                self.put('illust_detail', key, value, self.ttls['illust_detail'])
+            seeded.append((key, value))
+        self.seeded += len(seeded)
+        return seeded
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional, Tuple
+
+logger = logging.getLogger('pixiv-mcp-server')
+
+# 视为服务器过载/限流的 HTTP 状态码
+_CONGESTION_STATUSES = {403, 429, 503}
+
+def is_congestion_error(exc: Optional[BaseException]) -> bool:
+    """判断异常（或其 __cause__）是否表示被限流或网络拥塞：429/403/503、超时或 Pixiv 的 Rate Limit 错误。"""
+    # aiohttp 尚未导入时不可能出现它的异常；不在这里导入，避免首次出错时阻塞事件循环
+    aiohttp = sys.modules.get('aiohttp')
+    while exc is not None:
+        if aiohttp is not None and isinstance(exc, aiohttp.ClientResponseError):
+            if exc.status in _CONGESTION_STATUSES:
+                return True
+        elif isinstance(exc, asyncio.TimeoutError) or 'rate limit' in str(exc).lower():
+            return True
+        exc = exc.__cause__
+    return False
+
+def _describe(exc: BaseException) -> str:
+    aiohttp = sys.modules.get('aiohttp')
+    if aiohttp is not None and isinstance(exc, aiohttp.ClientResponseError):
+        return f"HTTP {exc.status}"
+    return str(exc) or type(exc).__name__
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发控制器，替代固定大小的信号量。
+
+    - 并发：slot() 占用槽位，只根据退出时的异常判断拥塞；
+    - 加性增：连续 limit 个健康的请求（响应时间未明显高于基线）后上限 +1；
+    - 乘性减：遇到限流/超时时上限乘以 backoff，cooldown 秒内只减一次，避免同一波错误连续砍半；
+    - 延迟：由下载引擎对每个请求调用 observe_latency 报告首字节时间，而不是整个作品的耗时
+      （后者随页数和文件大小变化，无法反映服务器负载）。慢速 EWMA 作为基线、快速 EWMA 反映近况，
+      近况超过基线 latency_tolerance 倍时暂停增长。
+    最近的调整记录保存在 decisions 中供查看。
+    """
+    def __init__(self, initial: int = 5, min_limit: int = 1, max_limit: int = 16,
+                 backoff: float = 0.5, cooldown: float = 5.0, latency_tolerance: float = 2.0, history: int = 20):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial, self.min_limit), self.max_limit)
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+        self._healthy_streak = 0
+        self._last_decrease = 0.0
+        self._baseline_latency: Optional[float] = None
+        self._recent_latency: Optional[float] = None
+        # (时间戳, 旧上限, 新上限, 原因)
+        self.decisions: Deque[Tuple[float, int, int, str]] = deque(maxlen=history)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """占用一个并发槽位；因限流/超时退出时降低上限。"""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        error: Optional[BaseException] = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._observe_error(error)
+                self._cond.notify_all()
+
+    async def observe_latency(self, seconds: float):
+        """报告一个成功请求的响应时间（首字节时间），据此决定是否提高上限。"""
+        async with self._cond:
+            if self._observe_latency(seconds):
+                self._cond.notify_all()
+
+    @property
+    def latency(self) -> Tuple[Optional[float], Optional[float]]:
+        """返回 (近期响应时间, 基线响应时间)，单位秒。"""
+        return self._recent_latency, self._baseline_latency
+
+    def _observe_error(self, error: Optional[BaseException]):
+        if not is_congestion_error(error):
+            # 正常完成、取消或作品不存在等与负载无关的错误：不调整
+            return
+        self._healthy_streak = 0
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self._last_decrease = now
+            self._set_limit(max(self.min_limit, int(self.limit * self.backoff)), f"限流/超时: {_describe(error)}")
+
+    def _observe_latency(self, seconds: float) -> bool:
+        """更新延迟 EWMA，上限提高时返回 True。"""
+        if self._baseline_latency is None:
+            self._baseline_latency = self._recent_latency = seconds
+        else:
+            self._recent_latency = 0.7 * self._recent_latency + 0.3 * seconds
+            self._baseline_latency = 0.95 * self._baseline_latency + 0.05 * seconds
+        if self._recent_latency > self._baseline_latency * self.latency_tolerance:
+            self._healthy_streak = 0
+            return False
+
+        self._healthy_streak += 1
+        if self._healthy_streak >= self.limit and self.limit < self.max_limit:
+            self._healthy_streak = 0
+            self._set_limit(self.limit + 1, "健康")
+            return True
+        return False
+
+    def _set_limit(self, new_limit: int, reason: str):
+        if new_limit == self.limit:
+            return
+        self.decisions.append((time.time(), self.limit, new_limit, reason))
+        logger.info(f"下载并发上限调整: {self.limit} -> {new_limit} ({reason})")
+        self.limit = new_limit
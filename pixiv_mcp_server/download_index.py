@@ -0,0 +1,110 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    illust_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    variant TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    checksum TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (illust_id, page, variant)
+);
+CREATE TABLE IF NOT EXISTS works (
+    illust_id INTEGER NOT NULL,
+    variant TEXT NOT NULL,
+    page_count INTEGER NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (illust_id, variant)
+);
+"""
+
+def file_digest(path: str):
+    """返回文件内容的 sha256 对象。续传时可在其基础上继续 update。"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest
+
+def _is_under(path: str, root: str) -> bool:
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:
+        # Windows 下不同盘符
+        return False
+
+class DownloadIndex:
+    """本地下载索引，以 (illust_id, page, variant) 为键记录文件路径、大小和校验和。
+
+    variant 区分同一作品的不同产物，如原图 'original' 或动图的输出格式。
+    接口均为同步阻塞调用，应在线程中执行。
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """首次使用时才打开数据库，避免拖慢启动。"""
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._db = conn
+        return self._db
+
+    def record_file(self, illust_id: int, page: int, variant: str, path: str, checksum: Optional[str] = None):
+        """记录一个已落盘的文件。未提供校验和时读取文件计算。"""
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        if checksum is None:
+            checksum = file_digest(path).hexdigest()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (illust_id, page, variant, path, size, checksum, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (illust_id, page, variant, path, size, checksum, time.time())
+            )
+
+    def mark_complete(self, illust_id: int, variant: str, page_count: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO works (illust_id, variant, page_count, completed_at) VALUES (?, ?, ?, ?)",
+                (illust_id, variant, page_count, time.time())
+            )
+
+    def find_complete(self, illust_id: int, variants: Iterable[str], root: str) -> Optional[str]:
+        """若作品的某个 variant 已完整存在于 root 目录下（文件存在且大小一致），返回该 variant，否则返回 None。"""
+        root = os.path.abspath(root)
+        for variant in variants:
+            with self._lock:
+                work = self._conn.execute(
+                    "SELECT page_count FROM works WHERE illust_id = ? AND variant = ?", (illust_id, variant)
+                ).fetchone()
+                if work is None:
+                    continue
+                files = self._conn.execute(
+                    "SELECT path, size FROM files WHERE illust_id = ? AND variant = ? AND page < ?",
+                    (illust_id, variant, work[0])
+                ).fetchall()
+            if len(files) != work[0]:
+                continue
+            if all(_is_under(path, root) and os.path.isfile(path) and os.path.getsize(path) == size for path, size in files):
+                return variant
+        return None
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
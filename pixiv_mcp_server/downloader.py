@@ -1,15 +1,14 @@
 import asyncio
 import logging
 import os
-import shutil
-import subprocess
-import sys
-import zipfile
 from pathlib import Path
-from typing import Dict, List
+from typing import List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
+from .concurrency import is_congestion_error
+from .api import call_api
 from .state import state
+from .ugoira import UGOIRA_EXTENSIONS, convert_ugoira, has_pillow, resolve_format
 from .utils import (
     _generate_filename,
     _sanitize_filename,
@@ -18,124 +17,203 @@ from .utils import (
 )
 
 logger = logging.getLogger('pixiv-mcp-server')
-HAS_FFMPEG = check_ffmpeg()
 
-def _sync_convert_ugoira_to_gif(zip_path: str, frames: List[Dict], work_dir: str, output_gif_path: str) -> str:
-    """将 Ugoira 的 zip 文件同步转换为 GIF，并增强了错误处理。"""
-    temp_dir_path = Path(work_dir) / "temp_frames"
-    temp_dir_path.mkdir(exist_ok=True)
-    temp_dir = str(temp_dir_path)
+# 下载索引中的产物类型：插画/漫画原图为 'original'，动图为其输出格式名（gif/webp/apng/mp4/zip）
+ORIGINAL_VARIANT = 'original'
 
-    try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        frame_list_path = os.path.join(temp_dir, "frame_list.txt")
-        with open(frame_list_path, 'w', encoding='utf-8') as f:
-            for frame in frames:
-                duration = frame['delay'] / 1000.0
-                f.write(f"file '{os.path.basename(frame['file'])}'\n")
-                f.write(f"duration {duration}\n")
-
-        absolute_output_gif_path = str(Path(output_gif_path).resolve())
-
-        # 使用更先进的 palettegen/paletteuse 滤镜来提高GIF质量，避免颜色失真和黑色块
-        cmd = [
-            'ffmpeg',
-            '-f', 'concat',
-            '-safe', '0',
-            '-i', "frame_list.txt",
-            '-vf', "split[s0][s1];[s0]palettegen=stats_mode=single[p];[s1][p]paletteuse=new=1",
-            '-y',
-            absolute_output_gif_path
-        ]
-        
-        creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-        subprocess.run(
-            cmd, cwd=temp_dir, check=True, capture_output=True, 
-            text=True, encoding='utf-8', creationflags=creationflags
+class DownloadError(Exception):
+    """可预期的下载失败（API 错误、页面下载失败等）。"""
+
+def _collect_page_urls(illust: dict) -> List[Tuple[str, str]]:
+    """返回作品所有页面的 (原图URL, 目标文件名) 列表。"""
+    if illust.get('page_count', 1) == 1:
+        urls = [illust['meta_single_page']['original_image_url']]
+    else:
+        urls = [page['image_urls']['original'] for page in illust['meta_pages']]
+
+    pages = []
+    for i, url in enumerate(urls):
+        file_ext = os.path.splitext(os.path.basename(urlparse(url).path))[1]
+        pages.append((url, _generate_filename(illust, page_num=i) + file_ext))
+    return pages
+
+async def _download_pages(illust: dict, save_path_base: Path, progress=None):
+    """并发下载作品的所有页面。单个作品的并发受 PAGE_CONCURRENCY 限制，全局传输数由下载引擎限制。"""
+    page_semaphore = asyncio.Semaphore(state.page_concurrency)
+
+    async def _download_page(page: int, url: str, filename: str):
+        async with page_semaphore:
+            try:
+                checksum = await state.http.download(
+                    url, path=str(save_path_base), name=filename,
+                    on_bytes=progress.add_bytes if progress else None
+                )
+            except Exception:
+                if progress:
+                    await progress.page_finished(page, False)
+                raise
+        # 文件此前已存在时 checksum 为 None，由索引读取文件计算
+        await state.io_executor.run(
+            state.download_index.record_file,
+            illust['id'], page, ORIGINAL_VARIANT, str(save_path_base / filename), checksum
         )
-        return output_gif_path
-    except subprocess.CalledProcessError as e:
-        logger.error(f"FFmpeg conversion failed for {Path(output_gif_path).stem}. Exit code: {e.returncode}")
-        logger.error(f"FFmpeg stderr:\n{e.stderr}")
-        raise e
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during GIF conversion for {Path(output_gif_path).stem}: {e}")
-        raise e
-    finally:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        # 确保在转换完成后删除原始的zip文件
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-
-async def _background_download_single(illust_id: int):
-    """在背景下载单个作品，并应用智能存储和命名规则"""
-    async with state.download_semaphore:
-        logger.info(f"背景任务开始：处理作品 ID {illust_id}，当前并发数: {5 - state.download_semaphore._value}/{5}")
+        if progress:
+            await progress.page_finished(page, True)
+
+    pages = _collect_page_urls(illust)
+    if progress:
+        await progress.pages_planned([filename for _, filename in pages])
+        await progress.set_stage('downloading')
+    results = await asyncio.gather(
+        *(_download_page(i, url, filename) for i, (url, filename) in enumerate(pages)),
+        return_exceptions=True
+    )
+    failures = [(filename, result) for (_, filename), result in zip(pages, results) if isinstance(result, BaseException)]
+    for filename, error in failures:
+        logger.error(f"页面下载失败 ({illust.get('id')}): {filename}: {error}")
+    if failures:
+        # 优先以限流类错误作为 __cause__，供并发控制器判断是否需要退避
+        cause = next((error for _, error in failures if is_congestion_error(error)), failures[0][1])
+        raise DownloadError(f"{len(failures)}/{len(pages)} 个页面下载失败") from cause
+    await state.io_executor.run(state.download_index.mark_complete, illust['id'], ORIGINAL_VARIANT, len(pages))
+
+async def _record_ugoira(illust_id: int, ugoira_format: str, final_path: Path):
+    await state.io_executor.run(state.download_index.record_file, illust_id, 0, ugoira_format, str(final_path))
+    await state.io_executor.run(state.download_index.mark_complete, illust_id, ugoira_format, 1)
+
+class PendingEncode:
+    """zip 已下载、等待编码的动图。
+
+    创建前已在 state.encode_pool 中占用了一个名额；下载队列拿到后另起任务调用 run()，
+    worker 随即领取下一个条目，编码不再占用 worker。
+    """
+    def __init__(self, illust_id: int, zip_path: Path, frames: list, final_path: Path,
+                 ugoira_format: str, ugoira_preset: str, use_ffmpeg: bool, progress=None):
+        self.illust_id = illust_id
+        self.zip_path = zip_path
+        self.frames = frames
+        self.final_path = final_path
+        self.ugoira_format = ugoira_format
+        self.ugoira_preset = ugoira_preset
+        self.use_ffmpeg = use_ffmpeg
+        self.progress = progress
+
+    async def run(self) -> str:
+        """在进程池中编码并记录索引，返回 'done'。无论成功与否都会归还占用的名额。"""
+        try:
+            if self.progress:
+                await self.progress.set_stage('converting')
+        except BaseException:
+            state.encode_pool.release()
+            raise
         try:
-            detail_result = await asyncio.to_thread(state.api.illust_detail, illust_id)
+            await state.encode_pool.run_reserved(
+                convert_ugoira,
+                str(self.zip_path),
+                self.frames,
+                str(self.final_path),
+                self.ugoira_format,
+                self.ugoira_preset,
+                self.use_ffmpeg
+            )
+            await _record_ugoira(self.illust_id, self.ugoira_format, self.final_path)
+        except Exception as e:
+            logger.error(f"动图 {self.illust_id} 编码失败: {e}", exc_info=True)
+            raise
+        logger.info(f"背景任务成功：动图 {self.illust_id} 已保存为 {self.ugoira_format.upper()}: {self.final_path}")
+        return 'done'
+
+async def _background_download_single(illust_id: int, download_path: Optional[str] = None, progress=None,
+                                      ugoira_format: Optional[str] = None, ugoira_preset: Optional[str] = None) -> Union[str, PendingEncode]:
+    """在背景下载单个作品，并应用智能存储和命名规则。
+
+    返回 'done' 或 'skipped'；需要编码的动图在 zip 下载完成后返回 PendingEncode，由调用方执行编码。
+    失败时抛出 DownloadError（或底层异常），由下载队列记录。
+    progress 为可选的进度回调对象（见 jobs.JobItemProgress）。
+    ugoira_format/ugoira_preset 未指定时使用全局配置 UGOIRA_FORMAT/UGOIRA_PRESET。
+    本地索引显示作品已完整存在于下载目录时直接跳过，不发起任何网络请求。
+    """
+    download_root = download_path or state.download_path
+    # 无 FFmpeg 时改用 Pillow 编码；两者都无法编码所请求的格式时保留原始 zip
+    requested_format = ugoira_format or state.ugoira_format
+    # 首次检测会启动子进程，放到线程中执行
+    use_ffmpeg = await state.io_executor.run(check_ffmpeg)
+    ugoira_format = resolve_format(requested_format, use_ffmpeg, has_pillow())
+    if ugoira_format != requested_format:
+        logger.warning(f"无可用编码器生成 {requested_format}，动图将保留为原始 zip")
+    ugoira_preset = ugoira_preset or state.ugoira_preset
+    present = await state.io_executor.run(
+        state.download_index.find_complete, illust_id, (ORIGINAL_VARIANT, ugoira_format), download_root
+    )
+    if present:
+        logger.info(f"跳过作品 {illust_id}: 本地已存在完整副本 ({present})")
+        return 'skipped'
+
+    try:
+        async with state.download_limiter.slot():
+            logger.info(f"背景任务开始：处理作品 ID {illust_id}，当前并发数: {state.download_limiter.in_flight}/{state.download_limiter.limit}")
+            detail_result = await call_api('illust_detail', illust_id)
             error = handle_api_error(detail_result)
             if error:
-                logger.error(f"下载失败 ({illust_id}): 无法获取作品信息: {error}")
-                return
+                raise DownloadError(f"无法获取作品信息: {error}")
 
             illust = detail_result['illust']
             page_count = illust.get('page_count', 1)
             illust_type = illust.get('type')
             
-            save_path_base = Path(state.download_path)
+            save_path_base = Path(download_root)
             if page_count > 1 or illust_type == 'ugoira':
                 sub_folder_name = _sanitize_filename(f"{illust_id} - {illust.get('title', 'Untitled')}")
                 save_path_base = save_path_base / sub_folder_name
             
             save_path_base.mkdir(parents=True, exist_ok=True)
             
-            if illust_type == 'ugoira':
-                if not HAS_FFMPEG:
-                    logger.warning(f"跳过动图转换 ({illust_id}): 未找到 FFmpeg。")
-                    return
-                
-                metadata = await asyncio.to_thread(state.api.ugoira_metadata, illust_id)
-                error = handle_api_error(metadata)
-                if error:
-                    logger.error(f"下载失败 ({illust_id}): 无法获取动图元数据: {error}")
-                    return
-                
-                zip_url = metadata['ugoira_metadata']['zip_urls']['medium']
-                zip_filename = os.path.basename(urlparse(zip_url).path)
-                zip_path = save_path_base / zip_filename
-                
-                await asyncio.to_thread(state.api.download, zip_url, path=str(save_path_base))
-                logger.info(f"动图 {illust_id} 的 .zip 文件已下载至 {zip_path}")
-                
-                gif_filename_base = _generate_filename(illust)
-                final_gif_path = save_path_base / f"{gif_filename_base}.gif"
-
-                await asyncio.to_thread(
-                    _sync_convert_ugoira_to_gif,
-                    str(zip_path),
-                    metadata['ugoira_metadata']['frames'],
-                    str(save_path_base),
-                    str(final_gif_path)
-                )
-                logger.info(f"背景任务成功：动图 {illust_id} 已转换为 GIF: {final_gif_path}")
-
-            else:
-                if page_count == 1:
-                    url = illust['meta_single_page']['original_image_url']
-                    file_ext = os.path.splitext(os.path.basename(urlparse(url).path))[1]
-                    filename = _generate_filename(illust) + file_ext
-                    await asyncio.to_thread(state.api.download, url, path=str(save_path_base), name=filename)
-                else:
-                    for i, page in enumerate(illust['meta_pages']):
-                        url = page['image_urls']['original']
-                        file_ext = os.path.splitext(os.path.basename(urlparse(url).path))[1]
-                        filename = _generate_filename(illust, page_num=i) + file_ext
-                        await asyncio.to_thread(state.api.download, url, path=str(save_path_base), name=filename)
-                
+            if illust_type != 'ugoira':
+                await _download_pages(illust, save_path_base, progress)
                 logger.info(f"背景任务成功：插画 {illust_id} 已下载至 {save_path_base}")
+                return 'done'
 
-        except Exception as e:
-            logger.error(f"背景下载任务 ({illust_id}) 发生未预期错误: {e}", exc_info=True)
+            animation_filename_base = _generate_filename(illust)
+            final_path = save_path_base / f"{animation_filename_base}{UGOIRA_EXTENSIONS[ugoira_format]}"
+            if final_path.exists():
+                # 索引建立之前下载的动图：补录索引后跳过
+                await _record_ugoira(illust_id, ugoira_format, final_path)
+                logger.info(f"跳过动图 {illust_id}: {final_path} 已存在")
+                return 'skipped'
+
+            if progress:
+                await progress.set_stage('metadata')
+            metadata = await call_api('ugoira_metadata', illust_id)
+            error = handle_api_error(metadata)
+            if error:
+                raise DownloadError(f"无法获取动图元数据: {error}")
+            
+            zip_url = metadata['ugoira_metadata']['zip_urls']['medium']
+            zip_filename = os.path.basename(urlparse(zip_url).path)
+            zip_path = save_path_base / zip_filename
+            
+            if progress:
+                await progress.set_stage('downloading')
+            await state.http.download(
+                zip_url, path=str(save_path_base),
+                on_bytes=progress.add_bytes if progress else None
+            )
+            logger.info(f"动图 {illust_id} 的 .zip 文件已下载至 {zip_path}")
+
+        # zip 已到达，网络槽位已释放；CPU 密集的编码作为独立阶段交给进程池
+        frames = metadata['ugoira_metadata']['frames']
+        if ugoira_format == 'zip':
+            await state.io_executor.run(convert_ugoira, str(zip_path), frames, str(final_path), 'zip')
+            await _record_ugoira(illust_id, ugoira_format, final_path)
+            logger.info(f"背景任务成功：动图 {illust_id} 已保存为 ZIP: {final_path}")
+            return 'done'
+        # 进程池待处理名额已满时在此等待，对下载形成背压
+        await state.encode_pool.reserve()
+        return PendingEncode(illust_id, zip_path, frames, final_path, ugoira_format, ugoira_preset, use_ffmpeg, progress)
+
+    except DownloadError as e:
+        logger.error(f"下载失败 ({illust_id}): {e}")
+        raise
+    except Exception as e:
+        logger.error(f"背景下载任务 ({illust_id}) 发生未预期错误: {e}", exc_info=True)
+        raise
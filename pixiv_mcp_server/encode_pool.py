@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger('pixiv-mcp-server')
+
+class EncodePool:
+    """动图编码进程池，与下载并发控制相互独立。
+
+    进程数默认等于 CPU 核数；同时提交（运行中 + 排队中）的任务数受 max_pending 限制，
+    超出时 submit/reserve 会等待，从而对下载队列形成背压，避免已下载的 zip 无限堆积。
+    子进程一律以 spawn 方式启动：父进程此时已运行多个线程池并持有日志、SQLite 等锁，
+    fork 出的子进程可能在这些锁上死锁（Python 3.12 起对此发出警告）。
+    spawn 会在子进程中重新导入主模块，以 server/main.py 启动时因此也会构造 PixivState；
+    其数据库连接均为首次使用时才打开，子进程中不会触发。
+    """
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 2
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.max_pending)
+        # submitted: 已交给进程池（执行中或在进程池内排队）；waiting: 因背压尚未提交
+        self.submitted = 0
+        self.waiting = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            logger.info(f"动图编码进程池已启动，进程数: {self.workers}")
+        return self._executor
+
+    async def reserve(self):
+        """占用一个提交名额，名额已满时等待（背压）。之后必须调用 run_reserved 或 release 归还名额。"""
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.submitted += 1
+
+    def release(self):
+        self.submitted -= 1
+        self._slots.release()
+
+    async def run_reserved(self, func: Callable[..., Any], *args: Any) -> Any:
+        """在已占用的名额内于进程池中执行 func(*args)，结束后归还名额。"""
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.release()
+
+    async def submit(self, func: Callable[..., Any], *args: Any) -> Any:
+        """在进程池中执行 func(*args)。func 必须是可被 pickle 的模块级函数。"""
+        await self.reserve()
+        return await self.run_reserved(func, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,71 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+class NamedExecutor:
+    """具名、固定大小的线程池，替代共享默认执行器的 asyncio.to_thread。
+
+    不同类别的阻塞操作（元数据请求、下载 I/O、CPU 计算）各用一个池，批量下载占满自己的池时
+    不会拖慢交互式工具。记录排队数、执行中数量以及从提交到开始执行的等待时间。
+    """
+    def __init__(self, name: str, workers: int, history: int = 100):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.max_wait = 0.0
+        # 最近 history 次任务的排队等待时间（秒）
+        self.waits: deque = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'pixiv-{self.name}')
+        return self._executor
+
+    @property
+    def average_wait(self) -> float:
+        with self._lock:
+            return sum(self.waits) / len(self.waits) if self.waits else 0.0
+
+    def _call(self, submitted_at: float, func: Callable[[], Any]) -> Any:
+        wait = time.perf_counter() - submitted_at
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.waits.append(wait)
+            self.max_wait = max(self.max_wait, wait)
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """在本线程池中执行 func(*args, **kwargs)，与 asyncio.to_thread 一样传递 contextvars。"""
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        with self._lock:
+            self.queued += 1
+        future = self._get_executor().submit(self._call, time.perf_counter(), call)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 尚未开始执行的任务被取消时不会进入 _call，需要在这里归还排队计数
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
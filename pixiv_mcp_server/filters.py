@@ -0,0 +1,144 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from .pagination import PagedResult, collect_pages
+from .state import state
+
+ILLUST_TYPES = ('illust', 'manga', 'ugoira')
+
+# 服务器端排序：键函数均按降序排列，date_asc 除外
+SORT_KEYS = {
+    'bookmarks': lambda illust: illust.get('total_bookmarks') or 0,
+    'views': lambda illust: illust.get('total_view') or 0,
+    'date': lambda illust: illust.get('create_date') or '',
+    'date_asc': lambda illust: illust.get('create_date') or '',
+    'pages': lambda illust: illust.get('page_count') or 1,
+}
+
+# illust_ai_type: 0 未知, 1 非 AI, 2 AI 生成
+_AI_GENERATED = 2
+
+def parse_tags(tags: Union[None, str, Iterable[str]]) -> List[str]:
+    """标签参数可以是逗号分隔的字符串或列表，统一为小写列表。"""
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    return [tag.strip().lower() for tag in tags if tag and tag.strip()]
+
+def _tag_names(illust: Dict[str, Any]) -> set:
+    names = set()
+    for tag in illust.get('tags') or []:
+        for key in ('name', 'translated_name'):
+            if tag.get(key):
+                names.add(tag[key].lower())
+    return names
+
+class IllustFilter:
+    """作品筛选条件，可直接作为 collect_pages 的 accept 谓词。未设置的条件不参与判断。
+
+    include_tags 须全部命中，exclude_tags 命中任一即排除；标签同时匹配原名和翻译名（不区分大小写）。
+    日期为 YYYY-MM-DD，按 create_date 的日期部分比较，包含两端。exclude_r18 排除 x_restrict 非 0 的作品。
+    """
+    def __init__(self, min_bookmarks: Optional[int] = None, min_views: Optional[int] = None,
+                 include_tags: Union[None, str, Iterable[str]] = None, exclude_tags: Union[None, str, Iterable[str]] = None,
+                 illust_type: Optional[str] = None, min_page_count: Optional[int] = None, max_page_count: Optional[int] = None,
+                 start_date: Optional[str] = None, end_date: Optional[str] = None, ai_generated: Optional[bool] = None,
+                 exclude_r18: bool = False):
+        self.min_bookmarks = min_bookmarks
+        self.min_views = min_views
+        self.include_tags = parse_tags(include_tags)
+        self.exclude_tags = parse_tags(exclude_tags)
+        self.illust_type = illust_type
+        self.min_page_count = min_page_count
+        self.max_page_count = max_page_count
+        self.start_date = start_date
+        self.end_date = end_date
+        self.ai_generated = ai_generated
+        self.exclude_r18 = exclude_r18
+
+    @property
+    def active(self) -> bool:
+        return self.exclude_r18 or any(
+            value is not None and value != [] for name, value in vars(self).items() if name != 'exclude_r18'
+        )
+
+    def __call__(self, illust: Dict[str, Any]) -> bool:
+        if self.exclude_r18 and illust.get('x_restrict', 0) != 0:
+            return False
+        if self.min_bookmarks is not None and (illust.get('total_bookmarks') or 0) < self.min_bookmarks:
+            return False
+        if self.min_views is not None and (illust.get('total_view') or 0) < self.min_views:
+            return False
+        if self.illust_type is not None and illust.get('type') != self.illust_type:
+            return False
+        page_count = illust.get('page_count') or 1
+        if self.min_page_count is not None and page_count < self.min_page_count:
+            return False
+        if self.max_page_count is not None and page_count > self.max_page_count:
+            return False
+        day = (illust.get('create_date') or '')[:10]
+        if self.start_date is not None and day < self.start_date:
+            return False
+        if self.end_date is not None and day > self.end_date:
+            return False
+        if self.ai_generated is not None and (illust.get('illust_ai_type') == _AI_GENERATED) != self.ai_generated:
+            return False
+        if self.include_tags or self.exclude_tags:
+            names = _tag_names(illust)
+            if not all(tag in names for tag in self.include_tags):
+                return False
+            if any(tag in names for tag in self.exclude_tags):
+                return False
+        return True
+
+def _blank_to_none(value: Any) -> Any:
+    """客户端常把未填写的字符串参数传成空串，视同未指定。"""
+    if isinstance(value, str):
+        return value.strip() or None
+    return value
+
+def build_illust_filter(min_bookmarks: Optional[int] = None, min_views: Optional[int] = None,
+                        include_tags: Union[None, str, Iterable[str]] = None, exclude_tags: Union[None, str, Iterable[str]] = None,
+                        illust_type: Optional[str] = None, min_page_count: Optional[int] = None, max_page_count: Optional[int] = None,
+                        start_date: Optional[str] = None, end_date: Optional[str] = None, ai_generated: Optional[bool] = None,
+                        sort_by: Optional[str] = None,
+                        exclude_r18: bool = False) -> Tuple[Optional[IllustFilter], Optional[str], Optional[str]]:
+    """校验工具的筛选与排序参数，返回 (IllustFilter, sort_by, 错误信息)；参数有误时前两项为 None。
+
+    空字符串视为未指定。供 FastMCP 与 DXT 两个入口的作品列表工具共用。
+    """
+    include_tags, exclude_tags, illust_type, start_date, end_date, sort_by = (
+        _blank_to_none(value) for value in (include_tags, exclude_tags, illust_type, start_date, end_date, sort_by)
+    )
+    if illust_type and illust_type not in ILLUST_TYPES:
+        return None, None, f"错误：不支持的作品类型 '{illust_type}'，可选: {', '.join(ILLUST_TYPES)}。"
+    if sort_by and sort_by not in SORT_KEYS:
+        return None, None, f"错误：不支持的排序方式 '{sort_by}'，可选: {', '.join(SORT_KEYS)}。"
+    for name, value in (('start_date', start_date), ('end_date', end_date)):
+        if value and not re.fullmatch(r'\d{4}-\d{2}-\d{2}', value):
+            return None, None, f"错误：{name} 须为 YYYY-MM-DD 格式。"
+    illust_filter = IllustFilter(min_bookmarks, min_views, include_tags, exclude_tags, illust_type,
+                                 min_page_count, max_page_count, start_date, end_date, ai_generated, exclude_r18)
+    return illust_filter, sort_by, None
+
+async def collect_illusts(method: str, *args: Any, limit: Optional[int] = None, max_pages: Optional[int] = None,
+                          illust_filter: Optional[IllustFilter] = None, sort_by: Optional[str] = None,
+                          **kwargs: Any) -> PagedResult:
+    """自动翻页收集作品，在服务器端筛选并排序。
+
+    不排序时收集到 limit 条符合条件的作品即停止。指定 sort_by 时，需要先扫描足够多的页面再取前 limit 条，
+    未指定 max_pages 时扫描 state.sort_pages 页。result.positions 为各作品在原始列表中的位置（从 1 开始）。
+    """
+    accept = illust_filter if illust_filter is not None and illust_filter.active else None
+    if sort_by is None:
+        return await collect_pages(method, *args, limit=limit, max_pages=max_pages, accept=accept, **kwargs)
+
+    result = await collect_pages(method, *args, max_pages=max_pages or state.sort_pages, accept=accept, **kwargs)
+    ranked = sorted(zip(result.items, result.positions), key=lambda pair: SORT_KEYS[sort_by](pair[0]),
+                    reverse=sort_by != 'date_asc')
+    if limit is not None:
+        ranked = ranked[:limit]
+    result.items = [illust for illust, _ in ranked]
+    result.positions = [position for _, position in ranked]
+    return result
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+from .download_index import file_digest
+from .executors import NamedExecutor
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger('pixiv-mcp-server')
+
+# i.pximg.net 会校验 Referer，缺失时直接返回 403
+PIXIV_REFERER = "https://app-api.pixiv.net/"
+USER_AGENT = "PixivIOSApp/7.13.3 (iOS 14.6; iPhone13,2)"
+CHUNK_SIZE = 64 * 1024
+PART_SUFFIX = '.part'
+
+def _parse_content_range_start(value: Optional[str]) -> Optional[int]:
+    """解析 `bytes 100-199/200` 中的起始偏移。"""
+    match = re.match(r'bytes (\d+)-\d+/', value or '')
+    return int(match.group(1)) if match else None
+
+def _parse_content_range_total(value: Optional[str]) -> Optional[int]:
+    """解析 `bytes */200` 或 `bytes 100-199/200` 中的总长度。"""
+    match = re.match(r'bytes [^/]+/(\d+)', value or '')
+    return int(match.group(1)) if match else None
+
+class AsyncDownloader:
+    """基于 aiohttp 的原生异步下载引擎，每个主机复用一个长连接会话。
+
+    提供 rate_limiter 时，每个请求消耗目标主机的 'requests' 令牌，每个数据块消耗 'bytes' 令牌；
+    提供 retry_policy 时，传输失败按策略退避后从断点续传。
+    续传前的校验和计算在 hash_executor 中执行，未提供时使用默认执行器。
+    提供 on_latency 时，每个成功的请求以其首字节时间（秒）调用，供自适应并发控制器参考。
+    """
+    def __init__(self, pool_size: int = 64, max_transfers: int = 32, proxy: Optional[str] = None, timeout: float = 60.0,
+                 rate_limiter: Optional[RateLimiter] = None, retry_policy: Optional[RetryPolicy] = None,
+                 hash_executor: Optional[NamedExecutor] = None,
+                 on_latency: Optional[Callable[[float], Awaitable[None]]] = None):
+        self.pool_size = pool_size
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self._run_blocking = hash_executor.run if hash_executor else asyncio.to_thread
+        self.on_latency = on_latency
+        # 全局在途传输上限，跨所有作品和页面共享
+        self.transfer_semaphore = asyncio.Semaphore(max_transfers)
+        self.proxy = proxy
+        self.timeout = timeout
+        self._sessions: Dict[str, 'aiohttp.ClientSession'] = {}
+        # 正在下载的目标文件 -> 传输结束时完成的 Future；同一文件的并发下载只进行一次
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _get_session(self, host: str) -> 'aiohttp.ClientSession':
+        """获取（或惰性创建）指定主机的会话。会话必须在事件循环内创建。"""
+        # aiohttp 导入较慢，推迟到第一次下载，不拖慢服务器启动
+        import aiohttp
+
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'User-Agent': USER_AGENT},
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+            )
+            self._sessions[host] = session
+        return session
+
+    @staticmethod
+    def _build_headers(url: str) -> Dict[str, str]:
+        host = urlparse(url).hostname or ''
+        if host.endswith('pximg.net'):
+            return {'Referer': PIXIV_REFERER}
+        return {}
+
+    async def download(self, url: str, path: str, name: Optional[str] = None, replace: bool = False,
+                       on_bytes: Optional[Callable[[int], None]] = None) -> Optional[str]:
+        """下载文件到 path/name。文件已存在且不替换时跳过并返回 None，否则返回文件的 SHA-256。
+
+        数据先以分块流式写入同目录下的 .part 文件，完成后原子重命名为目标文件。
+        若 .part 已存在（上次传输中断），则通过 HTTP Range 从断点续传。
+        同一文件的并发调用只有第一个实际传输，其余等待它结束后按文件已存在返回 None。
+        on_bytes 在每写入一个数据块后以该块的字节数调用，用于进度统计。
+        """
+        file_path = os.path.join(path, name or os.path.basename(urlparse(url).path))
+        # 同一文件已在下载（如重叠的下载任务包含相同作品）：等待其结束，避免两个写入者共用一个 .part。
+        # 对方成功时文件已存在，按已存在处理；失败时由本调用重新下载
+        inflight_key = os.path.abspath(file_path)
+        while inflight_key in self._inflight:
+            await asyncio.shield(self._inflight[inflight_key])
+            replace = False
+        if os.path.exists(file_path) and not replace:
+            return None
+
+        done = asyncio.get_running_loop().create_future()
+        self._inflight[inflight_key] = done
+        try:
+            return await self._download_to(url, file_path, on_bytes)
+        finally:
+            del self._inflight[inflight_key]
+            done.set_result(None)
+
+    async def _download_to(self, url: str, file_path: str, on_bytes: Optional[Callable[[int], None]]) -> str:
+        """经 .part 下载到 file_path，按 retry_policy 重试，返回 SHA-256。"""
+        part_path = file_path + PART_SUFFIX
+
+        async def attempt() -> str:
+            # 退避等待期间不占用传输槽位
+            async with self.transfer_semaphore:
+                return await self._fetch_to_part(url, part_path, on_bytes)
+
+        if self.retry_policy:
+            checksum = await self.retry_policy.run(attempt, f"下载 {os.path.basename(file_path)}")
+        else:
+            checksum = await attempt()
+        os.replace(part_path, file_path)
+        return checksum
+
+    async def _fetch_to_part(self, url: str, part_path: str, on_bytes: Optional[Callable[[int], None]] = None) -> str:
+        """将 url 的内容写入 part_path，已有内容视为断点，返回完整内容的 SHA-256。失败时保留 .part 以便下次续传。"""
+        import aiofiles
+        import aiohttp
+
+        host = urlparse(url).hostname or ''
+        session = self._get_session(host)
+        # 第二轮仅在断点失效（416 或区间不匹配）后从头重新下载
+        for _ in range(2):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = self._build_headers(url)
+            if offset:
+                headers['Range'] = f'bytes={offset}-'
+
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(host, 'requests')
+            # 计时从令牌桶放行之后开始，只反映服务器的响应速度
+            start = time.monotonic()
+            async with session.get(url, headers=headers, proxy=self.proxy) as response:
+                if self.on_latency and response.status < 400:
+                    await self.on_latency(time.monotonic() - start)
+                if response.status == 416:
+                    total = _parse_content_range_total(response.headers.get('Content-Range'))
+                    if total is not None and total == offset:
+                        digest = await self._run_blocking(file_digest, part_path)
+                        return digest.hexdigest()
+                    logger.warning(f"断点无效，重新下载: {url}")
+                    os.remove(part_path)
+                    continue
+                response.raise_for_status()
+
+                if response.status == 206:
+                    if _parse_content_range_start(response.headers.get('Content-Range')) != offset:
+                        logger.warning(f"服务器返回的续传区间不匹配，重新下载: {url}")
+                        os.remove(part_path)
+                        continue
+                    mode = 'ab'
+                    if offset:
+                        logger.info(f"从 {offset} 字节处续传: {url}")
+                        digest = await self._run_blocking(file_digest, part_path)
+                    else:
+                        digest = hashlib.sha256()
+                else:
+                    # 服务器忽略了 Range，返回完整内容
+                    offset = 0
+                    mode = 'wb'
+                    digest = hashlib.sha256()
+
+                expected = response.content_length
+                received = 0
+                async with aiofiles.open(part_path, mode) as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        await f.write(chunk)
+                        digest.update(chunk)
+                        received += len(chunk)
+                        if self.rate_limiter:
+                            await self.rate_limiter.acquire(host, 'bytes', len(chunk))
+                        if on_bytes:
+                            on_bytes(len(chunk))
+                if expected is not None and received != expected:
+                    raise aiohttp.ClientPayloadError(f"传输不完整: 期望 {expected} 字节，实际 {received} 字节")
+                return digest.hexdigest()
+        raise aiohttp.ClientError(f"无法续传: {url}")
+
+    async def close(self):
+        """关闭所有会话及其连接池。"""
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
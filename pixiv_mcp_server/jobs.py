@@ -0,0 +1,462 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .executors import NamedExecutor
+
+logger = logging.getLogger('pixiv-mcp-server')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    total_items INTEGER NOT NULL,
+    ugoira_format TEXT,
+    ugoira_preset TEXT
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    illust_id INTEGER NOT NULL,
+    download_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    stage TEXT,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    owner TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status, item_id);
+CREATE INDEX IF NOT EXISTS idx_job_items_job ON job_items (job_id);
+CREATE TABLE IF NOT EXISTS job_pages (
+    item_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    PRIMARY KEY (item_id, page)
+);
+"""
+
+# 旧版本数据库缺少的列：(表, 列, 类型)
+_ADDED_COLUMNS = [
+    ('jobs', 'ugoira_format', 'TEXT'),
+    ('jobs', 'ugoira_preset', 'TEXT'),
+    ('job_items', 'owner', 'TEXT'),
+]
+
+# worker 遇到意外错误（如数据库被锁）后的退避时间范围，单位秒
+_WORKER_BACKOFF_MIN = 1.0
+_WORKER_BACKOFF_MAX = 30.0
+
+def _try_lock(f) -> bool:
+    """以非阻塞方式获取文件的排他锁，成功时返回 True。锁随文件关闭（包括进程退出）释放。"""
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+class ProcessLock:
+    """进程存活标记：运行期间持有 directory/<owner_id>.lock 的排他锁。
+
+    下载条目记录领取它的 owner_id。多个服务器进程（每个 MCP 会话一个）共用同一个队列数据库时，
+    其他进程能获得某个 owner 的锁，说明该进程已退出（包括崩溃），它的 running 条目才可以恢复。
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.owner_id = uuid.uuid4().hex[:12]
+        self._file = None
+
+    def _path(self, owner_id: str) -> str:
+        return os.path.join(self.directory, f"{owner_id}.lock")
+
+    def acquire(self):
+        os.makedirs(self.directory, exist_ok=True)
+        f = open(self._path(self.owner_id), 'a+b')
+        if not _try_lock(f):
+            f.close()
+            raise RuntimeError(f"无法锁定 {self._path(self.owner_id)}")
+        self._file = f
+
+    def release(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        try:
+            os.remove(self._path(self.owner_id))
+        except OSError:
+            pass
+
+    def is_alive(self, owner_id: str) -> bool:
+        if owner_id == self.owner_id:
+            return self._file is not None
+        path = self._path(owner_id)
+        try:
+            f = open(path, 'a+b')
+        except OSError:
+            return False
+        with f:
+            if not _try_lock(f):
+                return True
+        # 锁已无人持有：清理遗留的锁文件
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return False
+
+class JobStore:
+    """基于 SQLite 的下载任务持久化存储。接口均为同步阻塞调用，应在线程中执行。"""
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        for table, column, column_type in _ADDED_COLUMNS:
+            existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def create_job(self, illust_ids: Iterable[int], download_path: str,
+                   ugoira_format: Optional[str] = None, ugoira_preset: Optional[str] = None) -> Tuple[str, int]:
+        """创建一个任务及其所有作品条目，返回 (job_id, 条目数)。动图格式/预设为空时由下载时的全局配置决定。"""
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        rows = [(job_id, illust_id, download_path, now) for illust_id in illust_ids]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, created_at, total_items, ugoira_format, ugoira_preset) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, now, len(rows), ugoira_format, ugoira_preset)
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_items (job_id, illust_id, download_path, updated_at) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id, len(rows)
+
+    def claim_next(self, owner: Optional[str] = None) -> Optional[Tuple[int, str, int, str, Optional[str], Optional[str]]]:
+        """取出最早的待处理条目，标记为 running 并记录领取者 owner，
+        返回 (item_id, job_id, illust_id, download_path, ugoira_format, ugoira_preset)。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT i.item_id, i.job_id, i.illust_id, i.download_path, j.ugoira_format, j.ugoira_preset "
+                "FROM job_items i JOIN jobs j ON j.job_id = i.job_id "
+                "WHERE i.status = 'pending' ORDER BY i.item_id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE job_items SET status = 'running', owner = ?, attempts = attempts + 1, updated_at = ? WHERE item_id = ?",
+                (owner, time.time(), row[0])
+            )
+            return row
+
+    def finish_item(self, item_id: int, status: str, error: Optional[str] = None, transferred: int = 0):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET status = ?, stage = NULL, error = ?, bytes = bytes + ?, updated_at = ? WHERE item_id = ?",
+                (status, error, transferred, time.time(), item_id)
+            )
+
+    def set_stage(self, item_id: int, stage: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET stage = ?, updated_at = ? WHERE item_id = ?",
+                (stage, time.time(), item_id)
+            )
+
+    def set_pages(self, item_id: int, filenames: List[str]):
+        """记录作品的页面列表。重复调用时保留已完成页面的状态。"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO job_pages (item_id, page, filename) VALUES (?, ?, ?)",
+                [(item_id, page, filename) for page, filename in enumerate(filenames)]
+            )
+
+    def finish_page(self, item_id: int, page: int, status: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_pages SET status = ? WHERE item_id = ? AND page = ?",
+                (status, item_id, page)
+            )
+
+    def job_summary(self, job_id: str, max_errors: int = 10) -> Optional[Dict[str, Any]]:
+        """汇总单个任务的进度：各状态条目数、页面进度、已传输字节数和最近的错误。"""
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT created_at, total_items FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            statuses = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            pages_done, pages_total = self._conn.execute(
+                "SELECT COALESCE(SUM(p.status = 'done'), 0), COUNT(p.page) FROM job_pages p "
+                "JOIN job_items i ON i.item_id = p.item_id WHERE i.job_id = ?", (job_id,)
+            ).fetchone()
+            transferred = self._conn.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM job_items WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            errors = self._conn.execute(
+                "SELECT illust_id, error FROM job_items WHERE job_id = ? AND status = 'failed' "
+                "ORDER BY updated_at DESC LIMIT ?", (job_id, max_errors)
+            ).fetchall()
+            running = self._conn.execute(
+                "SELECT item_id, illust_id, stage FROM job_items WHERE job_id = ? AND status = 'running'", (job_id,)
+            ).fetchall()
+        return {
+            'job_id': job_id,
+            'created_at': job[0],
+            'total_items': job[1],
+            'statuses': statuses,
+            'pages_done': pages_done,
+            'pages_total': pages_total,
+            'bytes': transferred,
+            'errors': errors,
+            'running': running,
+        }
+
+    def recent_jobs(self, limit: int = 5) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def recover(self, is_alive: Callable[[str], bool] = lambda owner: False) -> int:
+        """将领取者已退出的 running 条目重置为 pending，返回待处理条目总数。
+
+        is_alive(owner) 判断领取者是否仍在运行；其他存活进程正在处理的条目保持不变。未记录领取者的旧条目视为已退出。
+        """
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT owner FROM job_items WHERE status = 'running'"
+            )]
+            for owner in owners:
+                if owner is None or not is_alive(owner):
+                    self._conn.execute(
+                        "UPDATE job_items SET status = 'pending', owner = NULL, updated_at = ? "
+                        "WHERE status = 'running' AND owner IS ?",
+                        (time.time(), owner)
+                    )
+            return self._conn.execute("SELECT COUNT(*) FROM job_items WHERE status = 'pending'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ThroughputMeter:
+    """滚动窗口吞吐量统计：记录传输字节和完成条目，计算最近 window 秒内的 MB/s 与 items/s。"""
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._events: deque = deque()
+
+    def record(self, nbytes: int = 0, items: int = 0):
+        now = time.monotonic()
+        self._events.append((now, nbytes, items))
+        self._prune(now)
+
+    def _prune(self, now: float):
+        while self._events and now - self._events[0][0] > self.window:
+            self._events.popleft()
+
+    def rates(self) -> Tuple[float, float]:
+        """返回 (MB/s, items/s)。"""
+        now = time.monotonic()
+        self._prune(now)
+        if not self._events:
+            return 0.0, 0.0
+        # 以最早事件至今的时长（至少 1 秒）为分母，避免任务刚开始时速率被低估
+        span = max(now - self._events[0][0], 1.0)
+        total_bytes = sum(event[1] for event in self._events)
+        total_items = sum(event[2] for event in self._events)
+        return total_bytes / span / (1024 * 1024), total_items / span
+
+class JobItemProgress:
+    """单个作品条目的进度回调，由下载器在处理过程中调用。字节数实时累计在内存中，条目结束时落盘。"""
+    def __init__(self, store: JobStore, item_id: int, meters: List[ThroughputMeter],
+                 run_blocking: Callable[..., Awaitable[Any]] = asyncio.to_thread):
+        self.store = store
+        self._run_blocking = run_blocking
+        self.item_id = item_id
+        self.meters = meters
+        self.bytes = 0
+        self.stage: Optional[str] = None
+
+    def add_bytes(self, nbytes: int):
+        self.bytes += nbytes
+        for meter in self.meters:
+            meter.record(nbytes=nbytes)
+
+    async def set_stage(self, stage: str):
+        self.stage = stage
+        await self._run_blocking(self.store.set_stage, self.item_id, stage)
+
+    async def pages_planned(self, filenames: List[str]):
+        await self._run_blocking(self.store.set_pages, self.item_id, filenames)
+
+    async def page_finished(self, page: int, ok: bool):
+        await self._run_blocking(self.store.finish_page, self.item_id, page, 'done' if ok else 'failed')
+
+class DownloadQueue:
+    """持久化下载队列：固定数量的异步 worker 从 SQLite 中领取并处理条目。
+
+    数据库读写在 executor 中执行，未提供时使用默认执行器。
+    """
+    def __init__(self, db_path: str, workers: int = 5, executor: Optional[NamedExecutor] = None):
+        self.db_path = db_path
+        self._run_blocking = executor.run if executor else asyncio.to_thread
+        self.worker_count = workers
+        self._store: Optional[JobStore] = None
+        # 标记本进程存活，条目由哪个进程领取记录在 owner 列中
+        self.owner = ProcessLock(os.path.join(os.path.dirname(os.path.abspath(db_path)), 'owners'))
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.meter = ThroughputMeter()
+        self._job_meters: Dict[str, ThroughputMeter] = {}
+        # 正在处理的条目，用于实时读取传输字节数和阶段
+        self._active: Dict[int, JobItemProgress] = {}
+        # 下载完成、正在编码的动图条目；编码不占用 worker
+        self._encodes: Set[asyncio.Task] = set()
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = JobStore(self.db_path)
+        return self._store
+
+    async def start(self):
+        """启动 worker，并自动恢复上次未完成的条目。"""
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        await self._run_blocking(self.owner.acquire)
+        pending = await self._run_blocking(self.store.recover, self.owner.is_alive)
+        if pending:
+            logger.info(f"恢复 {pending} 个未完成的下载条目")
+        self._workers = [asyncio.create_task(self._worker_loop()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        tasks = self._workers + list(self._encodes)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._encodes.clear()
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+        self.owner.release()
+
+    async def enqueue(self, illust_ids: List[int], download_path: str,
+                      ugoira_format: Optional[str] = None, ugoira_preset: Optional[str] = None) -> Tuple[str, int]:
+        """将作品加入队列，返回 (job_id, 条目数)。"""
+        job_id, count = await self._run_blocking(
+            self.store.create_job, illust_ids, download_path, ugoira_format, ugoira_preset
+        )
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id, count
+
+    async def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """返回任务进度，合并数据库中的持久化状态与内存中的实时字节数和吞吐量。"""
+        summary = await self._run_blocking(self.store.job_summary, job_id)
+        if summary is None:
+            return None
+        running = []
+        for item_id, illust_id, stage in summary.pop('running'):
+            progress = self._active.get(item_id)
+            if progress is not None:
+                summary['bytes'] += progress.bytes
+                stage = progress.stage
+            running.append((illust_id, stage))
+        summary['running'] = running
+        meter = self._job_meters.get(job_id)
+        summary['mb_per_s'], summary['items_per_s'] = meter.rates() if meter else (0.0, 0.0)
+        return summary
+
+    async def recent_job_ids(self, limit: int = 5) -> List[str]:
+        return await self._run_blocking(self.store.recent_jobs, limit)
+
+    async def _worker_loop(self):
+        # 延迟导入：downloader 依赖 state，而 state 持有本队列
+        from .downloader import _background_download_single
+
+        backoff = _WORKER_BACKOFF_MIN
+        while True:
+            try:
+                # 先清除再领取，保证领取与等待之间的入队不会丢失唤醒
+                self._wakeup.clear()
+                claimed = await self._run_blocking(self.store.claim_next, self.owner.owner_id)
+                if claimed is None:
+                    await self._wakeup.wait()
+                    continue
+
+                item_id, job_id, illust_id, download_path, ugoira_format, ugoira_preset = claimed
+                job_meter = self._job_meters.setdefault(job_id, ThroughputMeter())
+                progress = JobItemProgress(self.store, item_id, [self.meter, job_meter], self._run_blocking)
+                self._active[item_id] = progress
+                await self._complete(item_id, job_meter, progress, _background_download_single(
+                    illust_id, download_path=download_path, progress=progress,
+                    ugoira_format=ugoira_format, ugoira_preset=ugoira_preset
+                ))
+                backoff = _WORKER_BACKOFF_MIN
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 如其他进程长时间占用数据库导致 "database is locked"：记录后退避重试，worker 不退出
+                logger.error(f"下载队列 worker 出错，{backoff:.0f} 秒后重试: {e}", exc_info=True)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, _WORKER_BACKOFF_MAX)
+
+    async def _complete(self, item_id: int, job_meter: ThroughputMeter, progress: JobItemProgress, work: Awaitable):
+        """等待 work 并记录条目结果。
+
+        work 返回 PendingEncode（zip 已下载的动图）时另起任务执行编码并在结束后记录结果，
+        不等待编码完成，worker 可以立即领取下一个条目；同时编码的数量由进程池的待处理名额限制。
+        """
+        from .downloader import PendingEncode
+
+        deferred = False
+        try:
+            status = await work
+            if isinstance(status, PendingEncode):
+                task = asyncio.create_task(self._complete(item_id, job_meter, progress, status.run()))
+                self._encodes.add(task)
+                task.add_done_callback(self._encodes.discard)
+                deferred = True
+                return
+            await self._run_blocking(self.store.finish_item, item_id, status, None, progress.bytes)
+        except asyncio.CancelledError:
+            # 服务器关闭：条目保持 running，下次启动时由 recover 重置
+            raise
+        except Exception as e:
+            await self._run_blocking(self.store.finish_item, item_id, 'failed', str(e), progress.bytes)
+        finally:
+            if not deferred:
+                self._active.pop(item_id, None)
+        self.meter.record(items=1)
+        job_meter.record(items=1)
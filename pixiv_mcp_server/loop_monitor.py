@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger('pixiv-mcp-server')
+
+class LoopLagMonitor:
+    """事件循环卡顿监测：定时休眠 interval 秒，实际唤醒比预期晚 threshold 秒以上即记为一次卡顿。
+
+    卡顿通常意味着有同步阻塞调用（如直接调用 pixivpy）占用了事件循环，期间所有工具调用和下载都会停顿。
+    """
+    def __init__(self, interval: float = 0.25, threshold: float = 0.1, history: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = 0
+        self.max_lag = 0.0
+        # 最近的卡顿记录：(时间戳, 延迟秒数)
+        self.recent: deque = deque(maxlen=history)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - expected
+            if lag >= self.threshold:
+                self.stalls += 1
+                self.max_lag = max(self.max_lag, lag)
+                self.recent.append((time.time(), lag))
+                logger.warning(f"事件循环卡顿 {lag * 1000:.0f} ms（阈值 {self.threshold * 1000:.0f} ms），可能存在阻塞调用")
@@ -0,0 +1,156 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Iterable, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    method TEXT NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    compressed INTEGER NOT NULL,
+    payload BLOB NOT NULL
+);
+-- 早期版本按作品/用户 ID 查找时建立的索引；现在只按 key 查找，删除以免增加写入开销
+DROP INDEX IF EXISTS entries_illust;
+DROP INDEX IF EXISTS entries_user;
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+"""
+
+# 持久化的接口：作品、用户和排行榜。搜索等结果变化快，只保留在内存缓存中
+PERSISTENT_METHODS = frozenset({'illust_detail', 'ugoira_metadata', 'user_detail', 'illust_ranking'})
+
+# 超出容量时淘汰到容量的这一比例，避免每次写入都触发淘汰
+_EVICT_TARGET = 0.9
+
+# (method, key, 响应, 过期时间戳或 None)
+Row = Tuple[str, str, Any, Optional[float]]
+
+class MetadataStore:
+    """持久化的 API 元数据缓存，服务器重启后仍可复用作品、用户和排行榜数据。
+
+    以 ResponseCache 的键存储响应 JSON，可选 zlib 压缩；过期时间与内存缓存一致。
+    总大小超过 max_bytes 时先删除过期条目，再按最近访问时间淘汰。
+    接口均为同步阻塞调用，应在线程中执行。
+    """
+    def __init__(self, db_path: str, max_bytes: int = 64 * 1024 * 1024, compress: bool = True):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._total_bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """首次使用时才打开数据库，避免拖慢启动。"""
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            self._db = conn
+        return self._db
+
+    def persistable(self, method: str) -> bool:
+        return self.enabled and method in PERSISTENT_METHODS
+
+    def _encode(self, value: Any) -> Tuple[bytes, bool]:
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if self.compress:
+            return zlib.compress(data), True
+        return data, False
+
+    @staticmethod
+    def _decode(payload: bytes, compressed: bool) -> Any:
+        if compressed:
+            payload = zlib.decompress(payload)
+        return json.loads(payload)
+
+    def get(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        """返回 (响应, 过期时间戳或 None)；不存在或已过期时返回 None。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, compressed, payload FROM entries "
+                "WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return self._decode(row[2], row[1]), row[0]
+
+    def put_many(self, rows: Iterable[Row]):
+        """在一个事务中写入多条响应，必要时淘汰旧条目。"""
+        encoded = []
+        now = time.time()
+        for method, key, value, expires_at in rows:
+            payload, compressed = self._encode(value)
+            encoded.append((key, method, expires_at, now, len(payload), int(compressed), payload))
+        if not encoded:
+            return
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                for entry in encoded:
+                    old = conn.execute("SELECT size FROM entries WHERE key = ?", (entry[0],)).fetchone()
+                    conn.execute(
+                        "INSERT OR REPLACE INTO entries "
+                        "(key, method, expires_at, accessed_at, size, compressed, payload) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        entry
+                    )
+                    self._total_bytes += entry[4] - (old[0] if old else 0)
+                if self._total_bytes > self.max_bytes:
+                    self._evict(conn, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                raise
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        target = int(self.max_bytes * _EVICT_TARGET)
+        removed = conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)).rowcount
+        self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        excess = self._total_bytes - target
+        if excess > 0:
+            victims: List[Tuple[str, int]] = []
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+                victims.append((key, size))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+            self._total_bytes -= sum(size for _, size in victims)
+            removed += len(victims)
+        self.evictions += removed
+
+    @property
+    def size_bytes(self) -> int:
+        """已占用的字节数（数据库尚未打开时为 0）。"""
+        return self._total_bytes or 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,252 @@
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
+
+from .state import state
+
+OUTPUT_MODES = ('full', 'compact', 'json')
+
+# compact 模式未指定 fields 时输出的字段（点分路径，经过列表时对每个元素取值，如 tags.name）
+COMPACT_FIELDS = {
+    'illust': ('id', 'title', 'type', 'user.id', 'user.name', 'page_count', 'total_bookmarks', 'total_view', 'tags.name'),
+    'illust_detail': ('id', 'title', 'type', 'user.id', 'user.name', 'create_date', 'page_count', 'width', 'height',
+                      'total_bookmarks', 'total_view', 'x_restrict', 'illust_ai_type', 'tags.name'),
+    'user': ('user.id', 'user.name', 'user.account', 'user.is_followed'),
+    'tag': ('tag', 'translated_name', 'illust.id'),
+}
+
+def parse_fields(fields: Union[None, str, Iterable[str]]) -> List[str]:
+    """字段参数可以是逗号分隔的字符串或列表。"""
+    if not fields:
+        return []
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    return [field.strip() for field in fields if field and field.strip()]
+
+def get_path(obj: Any, path: str) -> Any:
+    """按点分路径取值；路径经过列表时对每个元素取值并返回列表，缺失的字段为 None。"""
+    for part in path.split('.'):
+        if isinstance(obj, list):
+            obj = [get_path(element, part) for element in obj]
+        elif isinstance(obj, dict):
+            obj = obj.get(part)
+        else:
+            return None
+    return obj
+
+def project(obj: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    """只保留指定字段，以点分路径为键。"""
+    return {field: get_path(obj, field) for field in fields}
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, list):
+        return ','.join(_cell(element) for element in value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (dict, tuple)):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    return str(value).replace('\n', ' ')
+
+def _dumps(payload: Any) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+def resolve_mode(output_mode: Optional[str]) -> str:
+    """工具参数优先，未指定时使用服务器默认的 OUTPUT_MODE。"""
+    return (output_mode or state.output_mode).lower()
+
+def _budget(value: Optional[int], default: int) -> int:
+    """工具参数优先（0 表示不限制），未指定时使用服务器默认值。"""
+    return max(0, default if value is None else value)
+
+def _continuation_hint(cursor: str) -> str:
+    return f"使用 continue_results 工具并传入 cursor=\"{cursor}\" 获取后续内容"
+
+def _cursor(entry: Dict[str, Any], position: str) -> str:
+    """游标为 "<条目键>:<位置>"。条目只在第一次截断时保存，之后不再修改，同一游标可重复使用并得到相同的内容。"""
+    entry['key'] = state.result_store.put(entry, entry.get('key'))
+    return f"{entry['key']}:{position}"
+
+def _head(entry: Dict[str, Any]) -> str:
+    """文本模式每段开头重复的标题和列名；json 模式不输出标题。"""
+    return '' if entry['mode'] == 'json' else entry['header'] + entry.get('columns', '')
+
+def _split(text: str, start: int, max_chars: int) -> int:
+    """返回从 start 起不超过 max_chars 个字符的截断位置，尽量在换行处截断。"""
+    end = len(text)
+    if max_chars and end - start > max_chars:
+        end = start + max_chars
+        newline = text.rfind('\n', start, end)
+        if newline > start:
+            end = newline + 1
+    return end
+
+def _emit_part(entry: Dict[str, Any], index: int, part: int, max_chars: int) -> str:
+    """单个条目本身超出 max_chars 时，按 _emit_text 的方式分段输出该条目。"""
+    blocks = entry['blocks']
+    block = blocks[index]
+    head = _head(entry) if part == 0 else ''
+    end = _split(block, part, max(1, max_chars - len(head)))
+    finished = end == len(block)
+    remaining = len(blocks) - index - (1 if finished else 0)
+    cursor = None
+    if not finished:
+        cursor = _cursor(entry, f"{index}.{end}")
+    elif remaining:
+        cursor = _cursor(entry, str(index + 1))
+
+    if entry['mode'] == 'json':
+        tail = dict(entry['meta'])
+        tail.update(offset=index, total=len(blocks), part_offset=part, part_length=len(block))
+        if cursor is not None:
+            tail.update(remaining=remaining, cursor=cursor)
+        extra = ''.join(f",{_dumps(key)}:{_dumps(value)}" for key, value in tail.items())
+        return f'{{"count":0,"items":[],"item_part":{_dumps(block[part:end])}{extra}}}'
+
+    text = head + block[part:end]
+    if index == 0 and finished:
+        text += entry['footer']
+    if not finished:
+        text += f"\n\n（第 {index + 1} 条过长，已显示 {end}/{len(block)} 个字符；{_continuation_hint(cursor)}）"
+    elif cursor is not None:
+        text += f"\n\n（已显示第 {index + 1} 条，共 {len(blocks)} 条；{_continuation_hint(cursor)}）"
+    return text
+
+def _emit_list(entry: Dict[str, Any], start: int, max_items: int, max_chars: int, part: int = 0) -> str:
+    """从第 start 条起取出不超过预算的条目；还有剩余时附上指向下一条的游标。"""
+    blocks, separator = entry['blocks'], entry['separator']
+    head = _head(entry)
+    used = len(head)
+    if start < len(blocks) and max_chars and (part or used + len(blocks[start]) > max_chars):
+        return _emit_part(entry, start, part, max_chars)
+    end = start
+    while end < len(blocks):
+        if max_items and end - start >= max_items:
+            break
+        used += len(blocks[end]) + len(separator)
+        if end > start and max_chars and used > max_chars:
+            break
+        end += 1
+    chunk = blocks[start:end]
+    remaining = len(blocks) - end
+    cursor = _cursor(entry, str(end)) if remaining else None
+
+    if entry['mode'] == 'json':
+        tail = dict(entry['meta'])
+        if start or remaining:
+            tail.update(offset=start, total=len(blocks))
+        if remaining:
+            tail.update(remaining=remaining, cursor=cursor)
+        extra = ''.join(f",{_dumps(key)}:{_dumps(value)}" for key, value in tail.items())
+        return f'{{"count":{len(chunk)},"items":[{",".join(chunk)}]{extra}}}'
+
+    text = head + separator.join(chunk)
+    if start == 0:
+        text += entry['footer']
+    if remaining:
+        text += f"\n\n（已显示第 {start + 1}-{end} 条，共 {len(blocks)} 条；{_continuation_hint(cursor)}）"
+    return text
+
+def _emit_text(entry: Dict[str, Any], start: int, max_chars: int) -> str:
+    """按字符预算分段输出单个对象的文本，尽量在换行处截断。"""
+    text = entry['text']
+    end = _split(text, start, max_chars)
+    if end < len(text):
+        cursor = _cursor(entry, str(end))
+        return text[start:end] + f"\n\n（已显示 {end}/{len(text)} 个字符；{_continuation_hint(cursor)}）"
+    return text[start:end]
+
+def render_list(items: Sequence[Dict[str, Any]], kind: str, full: Callable[[Dict[str, Any]], str], header: str,
+                output_mode: Optional[str] = None, fields: Union[None, str, Iterable[str]] = None,
+                result: Any = None, ranks: Optional[Sequence[int]] = None, separator: str = "\n\n",
+                max_items: Optional[int] = None, max_chars: Optional[int] = None,
+                footer: str = "", meta: Optional[Dict[str, Any]] = None) -> str:
+    """按输出模式渲染条目列表。
+
+    - full: 用 full 逐条格式化（指定 fields 时改为逐行输出字段），ranks 作为“第 N 名”前缀；
+    - compact: 首行为字段名，之后每条一行，字段值以 " | " 分隔；
+    - json: 不带 header 的紧凑 JSON，{"count", "items"[, "rank"...]}，result 为 PagedResult 时附带翻页信息。
+    footer 附加在文本模式的第一段末尾，meta 为 json 模式下附加的顶层字段。
+    超出 max_items/max_chars 预算时只返回前一部分，其余渲染好的条目保存在服务器端，由 continue_results 按游标取回；
+    单个条目超出 max_chars 时该条目也分段输出。
+    """
+    mode = resolve_mode(output_mode)
+    field_list = parse_fields(fields)
+    # 记录本次调用的预算，continue_results 未指定时沿用
+    entry: Dict[str, Any] = {'type': 'list', 'mode': mode, 'header': header, 'separator': separator,
+                             'footer': footer + (result.footer() if result is not None else ""),
+                             'max_items': _budget(max_items, state.output_max_items),
+                             'max_chars': _budget(max_chars, state.output_max_chars)}
+
+    if mode == 'json':
+        rows = [project(item, field_list) if field_list else item for item in items]
+        if ranks is not None:
+            rows = [{'rank': rank, **row} for rank, row in zip(ranks, rows)]
+        entry['blocks'] = [_dumps(row) for row in rows]
+        entry['meta'] = dict(meta or {})
+        if result is not None:
+            entry['meta'].update(pages=result.pages, has_more=result.next_url is not None)
+            if result.partial_error:
+                entry['meta']['partial_error'] = result.partial_error
+    elif mode == 'compact':
+        columns = field_list or list(COMPACT_FIELDS[kind])
+        entry['columns'] = ' | '.join((['rank'] if ranks is not None else []) + columns) + "\n"
+        entry['separator'] = "\n"
+        entry['blocks'] = []
+        for index, item in enumerate(items):
+            cells = [_cell(get_path(item, column)) for column in columns]
+            if ranks is not None:
+                cells.insert(0, str(ranks[index]))
+            entry['blocks'].append(' | '.join(cells))
+    else:
+        if field_list:
+            blocks = ["\n".join(f"{field}: {_cell(get_path(item, field))}" for field in field_list) for item in items]
+        else:
+            blocks = [full(item) for item in items]
+        if ranks is not None:
+            blocks = [f"第 {rank} 名: {block}" for rank, block in zip(ranks, blocks)]
+        entry['blocks'] = blocks
+
+    return _emit_list(entry, 0, entry['max_items'], entry['max_chars'])
+
+def render_object(obj: Dict[str, Any], kind: str, full: Callable[[Dict[str, Any]], str],
+                  output_mode: Optional[str] = None, fields: Union[None, str, Iterable[str]] = None,
+                  max_chars: Optional[int] = None) -> str:
+    """按输出模式渲染单个对象：json 为紧凑 JSON；compact 或指定 fields 时每行一个字段；否则用 full 格式化。
+
+    超出 max_chars 时分段输出，后续部分由 continue_results 取回。
+    """
+    mode = resolve_mode(output_mode)
+    field_list = parse_fields(fields)
+    if mode == 'json':
+        text = _dumps(project(obj, field_list) if field_list else obj)
+    elif mode == 'compact' or field_list:
+        columns = field_list or COMPACT_FIELDS[kind]
+        text = "\n".join(f"{field}: {_cell(get_path(obj, field))}" for field in columns)
+    else:
+        text = full(obj)
+    entry = {'type': 'text', 'text': text, 'max_chars': _budget(max_chars, state.output_max_chars)}
+    return _emit_text(entry, 0, entry['max_chars'])
+
+def continue_result(cursor: str, max_items: Optional[int] = None, max_chars: Optional[int] = None) -> Optional[str]:
+    """按游标取出被截断结果的下一部分；游标不存在或已过期时返回 None。
+
+    未指定 max_items/max_chars 时沿用原调用的预算。游标本身记录位置，重复使用同一游标返回相同的内容。
+    """
+    key, _, position = cursor.rpartition(':')
+    entry = state.result_store.get(key) if key else None
+    if entry is None:
+        return None
+    index, _, part = position.partition('.')
+    try:
+        index, part = int(index), int(part or 0)
+    except ValueError:
+        return None
+    max_chars = _budget(max_chars, entry['max_chars'])
+    if entry['type'] == 'text':
+        if not 0 <= index < len(entry['text']):
+            return None
+        return _emit_text(entry, index, max_chars)
+    if not 0 <= index < len(entry['blocks']) or not 0 <= part < len(entry['blocks'][index]):
+        return None
+    return _emit_list(entry, index, _budget(max_items, entry['max_items']), max_chars, part)
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from .api import call_api
+from .cache import _signature, normalize_args
+from .retry import classify_response
+from .state import state
+
+logger = logging.getLogger('pixiv-mcp-server')
+
+class PagedResult:
+    """自动翻页的结果。
+
+    response 为第一页的原始 JSON（出错时由调用方用 handle_api_error 处理）；items 为通过筛选的条目，
+    positions 为对应条目在未筛选列表中的位置（从 1 开始，如排行榜名次）；
+    next_url 非空表示还有未获取的页；partial_error 记录翻页中途出错的原因，已获取的结果仍然有效。
+    """
+    def __init__(self):
+        self.response: Any = None
+        self.items: List[Dict[str, Any]] = []
+        self.positions: List[int] = []
+        self.pages = 0
+        self.scanned = 0
+        self.next_url: Optional[str] = None
+        self.partial_error: Optional[str] = None
+
+    def footer(self) -> str:
+        """分页概况，多页或还有后续页时附加在工具输出末尾。"""
+        if self.pages <= 1 and not self.partial_error:
+            return ""
+        text = f"\n\n（共获取 {self.pages} 页，扫描 {self.scanned} 条{'，还有更多结果' if self.next_url else ''}）"
+        if self.partial_error:
+            text += f"\n注意: 翻页中途出错，结果可能不完整: {self.partial_error}"
+        return text
+
+def _next_kwargs(client: Any, func: Callable, base: Dict[str, Any], next_url: str) -> Dict[str, Any]:
+    """由 next_url 解析出下一页的参数。next_url 中方法不接受的参数被忽略，其余覆盖原参数。"""
+    params = _signature(func).parameters
+    next_qs = client.parse_qs(next_url) or {}
+    return {**base, **{key: value for key, value in next_qs.items() if key in params}}
+
+async def collect_pages(method: str, *args: Any, items_key: str = 'illusts', limit: Optional[int] = None,
+                        max_pages: Optional[int] = None, accept: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                        **kwargs: Any) -> PagedResult:
+    """沿 next_url 自动翻页，收集 items_key 下的条目。
+
+    - limit: 收集到这么多条（通过 accept 筛选的）条目后提前停止；
+    - max_pages: 最多获取的页数，不超过 state.max_pages。limit 和 max_pages 都未指定时只获取一页；
+    - 当前页即使全部通过筛选也不足 limit 时，下一页必然需要，此时先发出下一页请求再处理当前页。
+    第一页的异常直接抛出；后续页出错时停止翻页并记录在 partial_error 中。
+    """
+    client = await state.get_api()
+    func = getattr(client, method)
+    if max_pages is None:
+        max_pages = 1 if limit is None else state.max_pages
+    max_pages = max(1, min(max_pages, state.max_pages))
+
+    result = PagedResult()
+    base = normalize_args(func, args, kwargs)
+    pending: Optional[asyncio.Future] = asyncio.ensure_future(call_api(method, *args, **kwargs))
+
+    def fetch_next(next_url: str) -> asyncio.Future:
+        return asyncio.ensure_future(call_api(method, **_next_kwargs(client, func, base, next_url)))
+
+    try:
+        while pending is not None:
+            try:
+                response = await pending
+            except Exception as e:
+                if result.pages == 0:
+                    raise
+                result.partial_error = str(e)
+                break
+            pending = None
+            if result.pages == 0:
+                result.response = response
+                if classify_response(response) is not None:
+                    break
+            elif classify_response(response) is not None:
+                result.partial_error = (response['error'] or {}).get('message') or str(response['error'])
+                break
+
+            result.pages += 1
+            page_items = response.get(items_key) or []
+            result.next_url = response.get('next_url')
+            more_pages = result.next_url is not None and result.pages < max_pages
+            if more_pages and (limit is None or len(result.items) + len(page_items) < limit):
+                pending = fetch_next(result.next_url)
+
+            for item in page_items:
+                result.scanned += 1
+                if accept is None or accept(item):
+                    result.items.append(item)
+                    result.positions.append(result.scanned)
+                    if limit is not None and len(result.items) >= limit:
+                        break
+            if limit is not None and len(result.items) >= limit:
+                break
+            if pending is None and more_pages:
+                pending = fetch_next(result.next_url)
+    finally:
+        if pending is not None:
+            pending.cancel()
+    logger.debug(f"{method}: 翻页 {result.pages} 页，扫描 {result.scanned} 条，保留 {len(result.items)} 条")
+    return result
@@ -0,0 +1,70 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充令牌，最多积累 capacity 个，允许短时突发。
+
+    单次请求量超过容量时（如一个大数据块），只需等到桶满即可放行，差额记为欠账，
+    由后续请求等待补齐，长期平均速率仍不超过 rate。
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        # 串行化等待者，保证先到先得
+        self._lock = asyncio.Lock()
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        async with self._lock:
+            self._refill()
+            needed = min(amount, self.capacity)
+            if self.tokens < needed:
+                delay = (needed - self.tokens) / self.rate
+                self.waits += 1
+                self.waited_seconds += delay
+                await asyncio.sleep(delay)
+                self._refill()
+            self.tokens -= amount
+
+class RateLimiter:
+    """按主机划分的限速器，同一主机的请求数和字节数分别使用独立的令牌桶。
+
+    主机按后缀匹配（配置 'pximg.net' 即覆盖 i.pximg.net），未配置的主机不限速。
+    """
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+
+    def configure(self, host: str, kind: str, rate: float, burst: Optional[float] = None):
+        """为 host 设置 kind（'requests' 或 'bytes'）的速率和突发容量。rate <= 0 表示不限速。"""
+        if rate <= 0:
+            self._buckets.pop((host, kind), None)
+            return
+        self._buckets[(host, kind)] = TokenBucket(rate, burst if burst else rate)
+
+    def _bucket(self, host: str, kind: str) -> Optional[TokenBucket]:
+        for (bucket_host, bucket_kind), bucket in self._buckets.items():
+            if bucket_kind == kind and (host == bucket_host or host.endswith('.' + bucket_host)):
+                return bucket
+        return None
+
+    async def acquire(self, host: str, kind: str = 'requests', amount: float = 1.0):
+        """消耗 host 上 amount 个令牌，不足时等待。"""
+        bucket = self._bucket(host, kind)
+        if bucket is not None:
+            await bucket.acquire(amount)
+
+    def snapshot(self) -> List[Tuple[str, str, float, float, int, float]]:
+        """返回各令牌桶的 (主机, 类型, 速率, 容量, 等待次数, 累计等待秒数)。"""
+        return [
+            (host, kind, bucket.rate, bucket.capacity, bucket.waits, bucket.waited_seconds)
+            for (host, kind), bucket in self._buckets.items()
+        ]
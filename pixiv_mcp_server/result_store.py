@@ -0,0 +1,48 @@
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+class ResultStore:
+    """保存被截断的工具输出，供 continue_results 按游标取回后续部分，无需再次请求 API。
+
+    条目为已渲染的结果（见 output.py），按 LRU 保留最多 max_entries 个，ttl 秒未被访问即过期。
+    """
+    def __init__(self, max_entries: int = 64, ttl: float = 1800.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self.created = 0
+        self.expired = 0
+
+    def _purge(self, now: float):
+        while self._entries:
+            cursor, (touched, _) = next(iter(self._entries.items()))
+            if now - touched < self.ttl:
+                break
+            del self._entries[cursor]
+            self.expired += 1
+
+    def put(self, entry: Dict[str, Any], cursor: Optional[str] = None) -> str:
+        """保存条目并返回游标；传入已有游标时原位更新。"""
+        now = time.monotonic()
+        self._purge(now)
+        if cursor is None:
+            cursor = secrets.token_urlsafe(8)
+            self.created += 1
+        self._entries[cursor] = (now, entry)
+        self._entries.move_to_end(cursor)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return cursor
+
+    def get(self, cursor: str) -> Optional[Dict[str, Any]]:
+        self._purge(time.monotonic())
+        item = self._entries.get(cursor)
+        return item[1] if item is not None else None
+
+    def discard(self, cursor: str):
+        self._entries.pop(cursor, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import random
+import sys
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger('pixiv-mcp-server')
+
+# 错误分类
+AUTH = 'auth'            # token 失效：刷新后立即重试一次
+THROTTLE = 'throttle'    # 被限流：退避后重试，优先遵循 Retry-After
+TRANSIENT = 'transient'  # 5xx、连接重置、超时等：退避后重试
+PERMANENT = 'permanent'  # 作品不存在、参数错误等：不重试
+
+_TRANSIENT_STATUSES = {408, 500, 502, 503, 504}
+_THROTTLE_STATUSES = {403, 429}
+
+def classify_exception(exc: BaseException) -> str:
+    """对 aiohttp 和 pixivpy 抛出的异常进行分类。"""
+    # aiohttp 尚未导入时不可能出现它的异常；不在这里导入，避免首次出错时阻塞事件循环
+    aiohttp = sys.modules.get('aiohttp')
+    if aiohttp is not None and isinstance(exc, aiohttp.ClientResponseError):
+        if exc.status == 401:
+            return AUTH
+        if exc.status in _THROTTLE_STATUSES:
+            return THROTTLE
+        if exc.status in _TRANSIENT_STATUSES:
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)) or (aiohttp is not None and isinstance(exc, aiohttp.ClientError)):
+        return TRANSIENT
+    message = str(exc).lower()
+    if 'rate limit' in message:
+        return THROTTLE
+    # pixivpy 将底层 requests 异常包装为 "requests GET ... error: ..."，非 JSON 响应（如网关错误页）为 parse_json() error
+    if message.startswith('requests ') or 'parse_json() error' in message:
+        return TRANSIENT
+    if 'authentication required' in message:
+        return AUTH
+    return PERMANENT
+
+def classify_response(response: Any) -> Optional[str]:
+    """对 pixivpy 返回的 JSON 进行分类，正常响应返回 None。"""
+    if not isinstance(response, dict) or 'error' not in response:
+        return None
+    error = response['error'] or {}
+    message = f"{error.get('message') or ''} {error.get('reason') or ''}".lower()
+    if 'rate limit' in message:
+        return THROTTLE
+    if 'invalid_grant' in message or 'oauth' in message or 'unauthorized' in message:
+        return AUTH
+    return PERMANENT
+
+def _retry_after(exc: Optional[BaseException]) -> Optional[float]:
+    """读取 Retry-After（秒数或 HTTP 日期）。"""
+    headers = getattr(exc, 'headers', None)
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RetryPolicy:
+    """指数退避 + 抖动的重试策略。
+
+    每个操作最多尝试 max_attempts 次，且累计退避时间不超过 budget 秒（操作级重试预算）；
+    认证错误每个操作只刷新并重试一次。stats 按错误类别统计重试和放弃次数。
+    """
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 30.0, budget: float = 60.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.stats: Counter = Counter()
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间：指数增长的上限内取一半固定、一半随机。"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    async def run(self, func: Callable[[], Awaitable[Any]], label: str,
+                  classify_result: Optional[Callable[[Any], Optional[str]]] = None,
+                  on_auth: Optional[Callable[[], Awaitable[bool]]] = None) -> Any:
+        """执行 func 并按错误类别重试。
+
+        异常在重试耗尽后原样抛出；classify_result 判定为错误的返回值（如带 error 的 JSON）在重试耗尽后原样返回。
+        """
+        attempt = 0
+        waited = 0.0
+        auth_retried = False
+        while True:
+            attempt += 1
+            error: Optional[BaseException] = None
+            try:
+                result = await func()
+                kind = classify_result(result) if classify_result else None
+                if kind is None:
+                    return result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+                kind = classify_exception(e)
+
+            if kind == AUTH and on_auth and not auth_retried:
+                auth_retried = True
+                self.stats['auth_refresh'] += 1
+                logger.warning(f"{label}: 认证失效，刷新 token 后重试")
+                if await on_auth():
+                    attempt -= 1
+                    continue
+
+            delay = _retry_after(error) if kind == THROTTLE else None
+            if delay is None:
+                delay = self.backoff(attempt)
+            if kind in (PERMANENT, AUTH) or attempt >= self.max_attempts or waited + delay > self.budget:
+                if kind != PERMANENT:
+                    self.stats[f'{kind}_gave_up'] += 1
+                if error is not None:
+                    raise error
+                return result
+
+            self.stats[kind] += 1
+            waited += delay
+            reason = error if error is not None else result['error'].get('message')
+            logger.warning(f"{label}: 第 {attempt} 次尝试失败 ({kind}: {reason})，{delay:.1f} 秒后重试")
+            await asyncio.sleep(delay)
@@ -0,0 +1,36 @@
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict
+
+class SingleFlight:
+    """合并相同的并发请求：同一键在途时，后来的调用方等待同一个 future 而不重复发起请求。
+
+    只适用于幂等的只读请求。deduplicated 按方法统计被合并的调用次数，leaders 为实际发起的请求数。
+    """
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.leaders: Counter = Counter()
+        self.deduplicated: Counter = Counter()
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, method: str, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            self.leaders[method] += 1
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.deduplicated[method] += 1
+        # shield：单个调用方被取消不影响共享请求和其他等待者
+        return await asyncio.shield(future)
+
+    def _finish(self, key: str, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # 所有等待者都已取消时，避免出现 "exception was never retrieved" 警告
+        if not future.cancelled():
+            future.exception()
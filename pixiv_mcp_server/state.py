@@ -1,28 +1,174 @@
-import asyncio
 import logging
 import os
-from typing import Optional
+import threading
+from typing import TYPE_CHECKING, Optional
 
-from pixivpy3 import AppPixivAPI
+from .auth import TokenManager
+from .cache import ResponseCache
+from .concurrency import AdaptiveLimiter
+from .download_index import DownloadIndex
+from .encode_pool import EncodePool
+from .executors import NamedExecutor
+from .http_client import AsyncDownloader
+from .jobs import DownloadQueue
+from .loop_monitor import LoopLagMonitor
+from .metadata_store import MetadataStore
+from .ratelimit import RateLimiter
+from .result_store import ResultStore
+from .retry import RetryPolicy
+from .singleflight import SingleFlight
+from .ugoira import UGOIRA_FORMATS, UGOIRA_PRESETS
+
+if TYPE_CHECKING:
+    from pixivpy3 import AppPixivAPI
 
 logger = logging.getLogger('pixiv-mcp-server')
 
+def _env_choice(name: str, choices, default: str) -> str:
+    """读取取值受限的环境变量；不在可选值中时记录警告并使用默认值。"""
+    value = os.getenv(name, default).strip().lower()
+    if value not in choices:
+        logger.warning(f"{name}={value!r} 无效（可选: {', '.join(choices)}），改用默认值 {default}")
+        return default
+    return value
+
 class PixivState:
     """一个用于封装所有服务器状态的类。"""
     def __init__(self):
-        self.api = AppPixivAPI()
+        self._api: Optional['AppPixivAPI'] = None
+        self._api_lock = threading.Lock()
         self.is_authenticated = False
         self.user_id: Optional[int] = None
         self.refresh_token: Optional[str] = os.getenv('PIXIV_REFRESH_TOKEN')
         self.download_path = os.getenv('DOWNLOAD_PATH', './downloads')
         self.filename_template = os.getenv('FILENAME_TEMPLATE', '{author} - {title}_{id}')
-        # 新增：并发下载控制器，限制为5个并发
-        self.download_semaphore = asyncio.Semaphore(5)
+        # 持久化数据（下载队列等）的存放目录
+        self.data_dir = os.getenv('PIXIV_MCP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.pixiv-mcp-server'))
+        # 动图输出格式 (gif/webp/apng/mp4/zip) 与编码预设 (fast/quality)，可在每次下载时单独指定
+        self.ugoira_format = _env_choice('UGOIRA_FORMAT', UGOIRA_FORMATS, 'gif')
+        self.ugoira_preset = _env_choice('UGOIRA_PRESET', UGOIRA_PRESETS, 'quality')
+        # 在 access token 过期前 TOKEN_REFRESH_MARGIN 秒主动刷新，并发刷新合并为一次请求；
+        # token 缓存在数据目录中，重启后仍有效时直接复用
+        self.token_manager = TokenManager(
+            self,
+            refresh_margin=float(os.getenv('TOKEN_REFRESH_MARGIN', '300')),
+            cache_path=os.path.join(self.data_dir, 'token.json'),
+        )
+        # 自适应并发控制器：从 DOWNLOAD_CONCURRENCY 起步，健康时逐步提高，遇到限流/超时减半
+        self.download_limiter = AdaptiveLimiter(
+            initial=int(os.getenv('DOWNLOAD_CONCURRENCY', '5')),
+            min_limit=int(os.getenv('DOWNLOAD_CONCURRENCY_MIN', '1')),
+            max_limit=int(os.getenv('DOWNLOAD_CONCURRENCY_MAX', '16')),
+        )
+
+        # 阻塞操作按类别使用独立的线程池：pixivpy 请求与元数据缓存、下载相关的磁盘 I/O、校验和计算。
+        # 批量下载占满 I/O 池时，交互式工具的元数据请求不受影响；动图编码另由 encode_pool 的进程池执行
+        self.metadata_executor = NamedExecutor('metadata', int(os.getenv('METADATA_WORKERS', '8')))
+        self.io_executor = NamedExecutor('io', int(os.getenv('IO_WORKERS', '8')))
+        self.cpu_executor = NamedExecutor('cpu', int(os.getenv('CPU_WORKERS', '0')) or min(4, os.cpu_count() or 1))
+
+        # 事件循环卡顿监测：唤醒延迟超过 LOOP_LAG_THRESHOLD_MS 时记录并告警，0 表示关闭
+        self.loop_monitor = LoopLagMonitor(threshold=float(os.getenv('LOOP_LAG_THRESHOLD_MS', '100')) / 1000)
 
         proxy = os.getenv('https_proxy')
+        self.proxy = proxy
         if proxy:
-            self.api.set_proxy(proxy)
             logger.info(f"已配置代理: {proxy}")
 
+        # 按主机限速：API 元数据请求与图片请求数/字节数各自独立计量，速率为 0 表示不限
+        self.rate_limiter = RateLimiter()
+        self.rate_limiter.configure(
+            'app-api.pixiv.net', 'requests',
+            float(os.getenv('API_RATE_LIMIT', '2')), float(os.getenv('API_RATE_BURST', '5'))
+        )
+        self.rate_limiter.configure(
+            'pximg.net', 'requests',
+            float(os.getenv('IMAGE_RATE_LIMIT', '10')), float(os.getenv('IMAGE_RATE_BURST', '20'))
+        )
+        self.rate_limiter.configure(
+            'pximg.net', 'bytes',
+            float(os.getenv('IMAGE_BANDWIDTH_MB', '0')) * 1024 * 1024,
+            float(os.getenv('IMAGE_BANDWIDTH_BURST_MB', '0')) * 1024 * 1024
+        )
+
+        # API 只读接口的内存缓存（按接口 TTL + LRU），API_CACHE_SIZE 为最大条目数，0 表示禁用
+        self.api_cache = ResponseCache(max_entries=int(os.getenv('API_CACHE_SIZE', '1024')))
+        # 内存缓存之下的持久化元数据缓存（作品、用户、排行榜），重启后仍可命中；METADATA_CACHE_MB 为 0 时禁用
+        self.metadata_store = MetadataStore(
+            os.path.join(self.data_dir, 'metadata.sqlite3'),
+            max_bytes=int(float(os.getenv('METADATA_CACHE_MB', '64')) * 1024 * 1024),
+            compress=os.getenv('METADATA_CACHE_COMPRESS', 'true').lower() in ('1', 'true', 'yes'),
+        )
+        # 合并参数相同的并发只读 API 请求
+        self.singleflight = SingleFlight()
+        # API 调用和文件下载共用的重试策略
+        self.retry_policy = RetryPolicy(
+            max_attempts=int(os.getenv('RETRY_MAX_ATTEMPTS', '4')),
+            base_delay=float(os.getenv('RETRY_BASE_DELAY', '1')),
+            max_delay=float(os.getenv('RETRY_MAX_DELAY', '30')),
+            budget=float(os.getenv('RETRY_BUDGET', '60')),
+        )
+
+        # 原生异步下载引擎，连接池大小可通过 DOWNLOAD_POOL_SIZE 配置
+        self.http = AsyncDownloader(
+            pool_size=int(os.getenv('DOWNLOAD_POOL_SIZE', '64')),
+            max_transfers=int(os.getenv('MAX_TRANSFERS', '32')),
+            proxy=proxy,
+            rate_limiter=self.rate_limiter,
+            retry_policy=self.retry_policy,
+            hash_executor=self.cpu_executor,
+            on_latency=self.download_limiter.observe_latency,
+        )
+        # 列表工具自动翻页时最多获取的页数
+        self.max_pages = int(os.getenv('PAGINATION_MAX_PAGES', '20'))
+        # 服务器端排序且未指定 max_pages 时扫描的页数
+        self.sort_pages = int(os.getenv('PAGINATION_SORT_PAGES', '5'))
+        # 工具默认输出模式：full（可读文本）、compact（每条一行）或 json，可被工具的 output_mode 参数覆盖
+        self.output_mode = os.getenv('OUTPUT_MODE', 'full').lower()
+        # 未显式配置 OUTPUT_MODE 时，个别工具（如 illust_detail_batch）可使用更合适的默认模式
+        self.output_mode_configured = bool(os.getenv('OUTPUT_MODE'))
+        # 工具输出预算（0 表示不限制），超出部分保存在 result_store 中，由 continue_results 按游标取回
+        self.output_max_items = int(os.getenv('OUTPUT_MAX_ITEMS', '0'))
+        self.output_max_chars = int(os.getenv('OUTPUT_MAX_CHARS', '0'))
+        self.result_store = ResultStore(
+            max_entries=int(os.getenv('RESULT_STORE_SIZE', '64')),
+            ttl=float(os.getenv('RESULT_STORE_TTL', '1800')),
+        )
+        # 单个多页作品同时下载的页面数上限
+        self.page_concurrency = int(os.getenv('PAGE_CONCURRENCY', '8'))
+        # illust_detail_batch 单次调用最多接受的作品 ID 数
+        self.batch_max_ids = int(os.getenv('BATCH_MAX_IDS', '100'))
+        # 动图编码进程池，默认进程数为 CPU 核数
+        self.encode_pool = EncodePool(workers=int(os.getenv('ENCODE_WORKERS', '0')) or None)
+        # 本地下载索引：已完整下载的作品再次下载时直接跳过
+        self.download_index = DownloadIndex(os.path.join(self.data_dir, 'index.sqlite3'))
+        # 持久化下载队列，由固定数量的 worker 消费
+        self.job_queue = DownloadQueue(
+            os.path.join(self.data_dir, 'jobs.sqlite3'),
+            # worker 数默认等于并发上限，实际并发由 download_limiter 决定
+            workers=int(os.getenv('DOWNLOAD_WORKERS', '0')) or self.download_limiter.max_limit,
+            executor=self.io_executor,
+        )
+
+    @property
+    def api(self) -> 'AppPixivAPI':
+        """Pixiv API 客户端。首次使用时才导入 pixivpy 并创建，避免拖慢启动。"""
+        with self._api_lock:
+            if self._api is None:
+                import urllib3
+                from pixivpy3 import AppPixivAPI
+
+                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+                api = AppPixivAPI(proxies={'http': self.proxy, 'https': self.proxy}) if self.proxy else AppPixivAPI()
+                self.token_manager.bind(api)
+                self._api = api
+        return self._api
+
+    async def get_api(self) -> 'AppPixivAPI':
+        """在异步代码中获取客户端：首次创建（导入 pixivpy 约需上百毫秒）放到元数据线程池中，不阻塞事件循环。"""
+        if self._api is None:
+            return await self.metadata_executor.run(getattr, self, 'api')
+        return self._api
+
 # 创建全局唯一的 state 实例
 state = PixivState()
@@ -1,18 +1,42 @@
-import asyncio
 import json
 import logging
 import random
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
 from mcp.server.fastmcp import FastMCP
 
-from .downloader import _background_download_single
+from .api import call_api
+from .batch import render_illust_details
+from .filters import build_illust_filter, collect_illusts
+from .output import continue_result, render_list, render_object
+from .pagination import collect_pages
 from .state import state
-from .utils import format_illust_summary, format_user_summary, handle_api_error, handle_api_error_with_retry, refresh_token_if_needed
+from .utils import format_illust_summary, format_job_status, format_server_status, format_user_summary, handle_api_error, refresh_token_if_needed, validate_output_options, validate_ugoira_options
 
 logger = logging.getLogger('pixiv-mcp-server')
-mcp = FastMCP("pixiv-server")
+
+@asynccontextmanager
+async def server_lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """服务器生命周期：启动 token 主动刷新、事件循环卡顿监测和下载队列 worker（自动恢复未完成任务），退出时释放资源。"""
+    await state.token_manager.start()
+    await state.loop_monitor.start()
+    await state.job_queue.start()
+    try:
+        yield
+    finally:
+        await state.job_queue.stop()
+        await state.token_manager.stop()
+        await state.loop_monitor.stop()
+        await state.http.close()
+        state.encode_pool.shutdown()
+        for executor in (state.metadata_executor, state.io_executor, state.cpu_executor):
+            executor.shutdown()
+        state.download_index.close()
+        state.metadata_store.close()
+
+mcp = FastMCP("pixiv-server", lifespan=server_lifespan)
 
 @mcp.tool()
 async def set_download_path(path: str) -> str:
@@ -27,10 +51,15 @@ async def set_download_path(path: str) -> str:
         return f"错误：无法设置下载路径。请检查路径 '{path}' 是否有效且程序有写入权限。错误详情: {e}"
 
 @mcp.tool()
-async def download(illust_id: Optional[int] = None, illust_ids: Optional[List[int]] = None) -> str:
-    """下载一个或多个指定ID的作品。工具会自动判断类型并应用智能存储规则。此为异步后台操作。"""
+async def download(illust_id: Optional[int] = None, illust_ids: Optional[List[int]] = None,
+                   ugoira_format: Optional[str] = None, ugoira_preset: Optional[str] = None) -> str:
+    """下载一个或多个指定ID的作品。工具会自动判断类型并应用智能存储规则。此为异步后台操作。
+    动图可通过 ugoira_format (gif/webp/apng/mp4/zip) 和 ugoira_preset (fast/quality) 指定输出格式和编码预设，默认使用全局配置。"""
     if not illust_id and not illust_ids:
         return "错误：必须提供 illust_id (单个ID) 或 illust_ids (ID列表) 参数之一。"
+    error = validate_ugoira_options(ugoira_format, ugoira_preset)
+    if error:
+        return error
 
     id_list = []
     if illust_id:
@@ -40,10 +69,32 @@ async def download(illust_id: Optional[int] = None, illust_ids: Optional[List[in
     
     unique_ids = sorted(list(set(id_list)))
     
-    for an_id in unique_ids:
-        asyncio.create_task(_background_download_single(an_id))
+    job_id, _ = await state.job_queue.enqueue(
+        unique_ids, state.download_path,
+        ugoira_format.lower() if ugoira_format else None,
+        ugoira_preset.lower() if ugoira_preset else None
+    )
     
-    return f"已成功将 {len(unique_ids)} 个作品的下载任务派发至后台。请注意，动图(Ugoira)合成可能需要几十秒到数分钟，请耐心等待文件下载和处理完成。"
+    return f"已成功将 {len(unique_ids)} 个作品的下载任务派发至后台（任务ID: {job_id}）。可使用 download_status 工具查询进度。请注意，动图(Ugoira)合成可能需要几十秒到数分钟，请耐心等待文件下载和处理完成。"
+
+@mcp.tool()
+async def download_status(job_id: Optional[str] = None, include_server_stats: bool = False) -> str:
+    """查询下载任务的进度：条目状态、页面进度、已传输字节、动图转换阶段、错误和最近的传输速率。不提供 job_id 时显示最近的任务。
+
+    include_server_stats 为 True 时在前面附上服务器运行状态（自适应并发、限速、重试、缓存、线程池、事件循环卡顿）。
+    """
+    job_ids = [job_id] if job_id else await state.job_queue.recent_job_ids()
+    reports = [format_server_status()] if include_server_stats else []
+    if not job_ids:
+        reports.append("暂无下载任务。")
+    for an_id in job_ids:
+        summary = await state.job_queue.status(an_id)
+        if summary is None:
+            reports.append(f"找不到任务 {an_id}。")
+        else:
+            reports.append(format_job_status(summary))
+
+    return "\n\n".join(reports)
 
 @mcp.tool()
 async def refresh_token() -> str:
@@ -60,11 +111,11 @@ async def refresh_token() -> str:
 @mcp.tool()
 async def download_random_from_recommendation(count: int = 5) -> str:
     """从用户的Pixiv推荐页随机下载N张插画。此为完成此类请求的最佳方式，会自动处理下载和动图转换。"""
-    if not state.is_authenticated:
+    if not await state.token_manager.ensure_valid():
         return "错误: 此功能需要认证。请先使用 auth 工具或在客户端设置 PIXIV_REFRESH_TOKEN 环境变量。"
 
     try:
-        json_result = await asyncio.to_thread(state.api.illust_recommended)
+        json_result = await call_api('illust_recommended')
         error = handle_api_error(json_result)
         if error:
             return f"获取推荐列表失败: {error}"
@@ -93,81 +144,171 @@ async def search_illust(
     sort: str = "date_desc", 
     duration: Optional[str] = None, 
     offset: int = 0,
-    search_r18: bool = False
+    search_r18: bool = False,
+    limit: Optional[int] = None,
+    max_pages: Optional[int] = None,
+    min_bookmarks: Optional[int] = None,
+    min_views: Optional[int] = None,
+    include_tags: Optional[str] = None,
+    exclude_tags: Optional[str] = None,
+    illust_type: Optional[str] = None,
+    min_page_count: Optional[int] = None,
+    max_page_count: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    ai_generated: Optional[bool] = None,
+    sort_by: Optional[str] = None,
+    output_mode: Optional[str] = None,
+    fields: Optional[str] = None,
+    max_items: Optional[int] = None,
+    max_chars: Optional[int] = None
 ) -> str:
-    """根据关键词搜索插画。可选择是否包含 R-18 内容。支持自动token刷新。"""
+    """根据关键词搜索插画。可选择是否包含 R-18 内容。支持自动token刷新。limit/max_pages 用于一次调用自动翻页获取多页结果。
+
+    服务器端筛选：min_bookmarks、min_views、include_tags/exclude_tags（逗号分隔）、illust_type（illust/manga/ugoira）、
+    min_page_count/max_page_count、start_date/end_date（YYYY-MM-DD）、ai_generated；
+    sort_by（bookmarks/views/date/date_asc/pages）在扫描的全部页面上排序后取前 limit 条。
+
+    输出：output_mode 为 full（默认，可读文本）、compact（首行字段名，每个作品一行）或 json（紧凑 JSON）；
+    fields 指定只输出的字段，逗号分隔的点分路径，如 id,title,user.id,total_bookmarks,tags.name。
+    max_items/max_chars 限制本次返回的条数/字符数，超出部分保存在服务器端，用返回的 cursor 调用 continue_results 获取。
+    """
+    illust_filter, sort_by, error = build_illust_filter(min_bookmarks, min_views, include_tags, exclude_tags, illust_type,
+                                                        min_page_count, max_page_count, start_date, end_date, ai_generated, sort_by)
+    error = error or validate_output_options(output_mode, fields)
+    if error:
+        return error
     search_word = f"{word} R-18" if search_r18 else word
     
-    # 首次尝试API调用
-    json_result = await asyncio.to_thread(state.api.search_illust, search_word, search_target=search_target, sort=sort, duration=duration, offset=offset)
-    
-    # 使用新的错误处理机制，支持自动重试
-    error, retry_result = await handle_api_error_with_retry(
-        json_result, 
-        state.api.search_illust, 
-        search_word, 
-        search_target=search_target, 
-        sort=sort, 
-        duration=duration, 
-        offset=offset
-    )
-    
-    # 如果重试成功，使用新的结果
-    if retry_result:
-        json_result = retry_result
-    elif error:
+    # call_api 会在 token 失效时自动刷新并重试
+    result = await collect_illusts('search_illust', search_word, search_target=search_target, sort=sort, duration=duration, offset=offset,
+                                   limit=limit, max_pages=max_pages, illust_filter=illust_filter, sort_by=sort_by)
+    error = handle_api_error(result.response)
+    if error:
         return error
     
-    illusts = json_result.get('illusts', [])
+    illusts = result.items
     if not illusts:
         return f"抱歉，根据您提供的关键词 '{search_word}'，未能找到相关的插画。"
         
-    summary_list = [format_illust_summary(illust) for illust in illusts]
-    return f"找到 {len(illusts)} 张关于 '{search_word}' 的插画:\n\n" + "\n\n".join(summary_list)
+    return render_list(illusts, 'illust', format_illust_summary, f"找到 {len(illusts)} 张关于 '{search_word}' 的插画:\n\n",
+                       output_mode, fields, result, max_items=max_items, max_chars=max_chars)
 
 @mcp.tool()
-async def illust_detail(illust_id: int) -> str:
-    """获取单张插画的详细信息。"""
-    json_result = await asyncio.to_thread(state.api.illust_detail, illust_id)
+async def illust_detail(illust_id: int, output_mode: Optional[str] = None, fields: Optional[str] = None,
+                        max_chars: Optional[int] = None) -> str:
+    """获取单张插画的详细信息。output_mode=full 返回完整 JSON，compact 只返回常用字段，json 为不缩进的 JSON；fields、max_chars 同 search_illust。"""
+    error = validate_output_options(output_mode, fields)
+    if error:
+        return error
+    json_result = await call_api('illust_detail', illust_id)
     error = handle_api_error(json_result)
     if error:
         return error
-    return json.dumps(json_result.get('illust', {}), ensure_ascii=False, indent=2)
+    return render_object(json_result.get('illust', {}), 'illust_detail',
+                         lambda illust: json.dumps(illust, ensure_ascii=False, indent=2), output_mode, fields, max_chars=max_chars)
 
 @mcp.tool()
-async def illust_related(illust_id: int, offset: int = 0) -> str:
-    """获取与指定插画相关的推荐作品。"""
-    json_result = await asyncio.to_thread(state.api.illust_related, illust_id, offset=offset)
-    error = handle_api_error(json_result)
+async def illust_detail_batch(illust_ids: List[int], output_mode: Optional[str] = None, fields: Optional[str] = None,
+                              max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+    """一次获取多张插画的详细信息。已缓存的作品直接返回，其余并发获取；单个 ID 失败时单独列出错误，不影响其他作品。
+
+    默认以 compact 模式输出（每个作品一行），output_mode、fields、max_items/max_chars 同 search_illust。
+    """
+    return await render_illust_details(illust_ids, output_mode, fields, max_items, max_chars)
+
+@mcp.tool()
+async def illust_related(
+    illust_id: int,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    max_pages: Optional[int] = None,
+    min_bookmarks: Optional[int] = None,
+    min_views: Optional[int] = None,
+    include_tags: Optional[str] = None,
+    exclude_tags: Optional[str] = None,
+    illust_type: Optional[str] = None,
+    min_page_count: Optional[int] = None,
+    max_page_count: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    ai_generated: Optional[bool] = None,
+    sort_by: Optional[str] = None,
+    output_mode: Optional[str] = None,
+    fields: Optional[str] = None,
+    max_items: Optional[int] = None,
+    max_chars: Optional[int] = None
+) -> str:
+    """获取与指定插画相关的推荐作品。limit/max_pages 用于自动翻页，筛选、排序与输出参数同 search_illust。"""
+    illust_filter, sort_by, error = build_illust_filter(min_bookmarks, min_views, include_tags, exclude_tags, illust_type,
+                                                        min_page_count, max_page_count, start_date, end_date, ai_generated, sort_by)
+    error = error or validate_output_options(output_mode, fields)
+    if error:
+        return error
+    result = await collect_illusts('illust_related', illust_id, offset=offset, limit=limit, max_pages=max_pages,
+                                   illust_filter=illust_filter, sort_by=sort_by)
+    error = handle_api_error(result.response)
     if error:
         return error
     
-    illusts = json_result.get('illusts', [])
+    illusts = result.items
     if not illusts:
         return f"找不到与插画 {illust_id} 相关的推荐。"
         
-    summary_list = [format_illust_summary(illust) for illust in illusts]
-    return f"找到 {len(illusts)} 张相关推荐:\n\n" + "\n\n".join(summary_list)
+    return render_list(illusts, 'illust', format_illust_summary, f"找到 {len(illusts)} 张相关推荐:\n\n",
+                       output_mode, fields, result, max_items=max_items, max_chars=max_chars)
 
 @mcp.tool()
-async def illust_ranking(mode: str = "day", date: Optional[str] = None, offset: int = 0) -> str:
-    """获取插画排行榜。"""
-    json_result = await asyncio.to_thread(state.api.illust_ranking, mode=mode, date=date, offset=offset)
-    error = handle_api_error(json_result)
+async def illust_ranking(
+    mode: str = "day",
+    date: Optional[str] = None,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    max_pages: Optional[int] = None,
+    min_bookmarks: Optional[int] = None,
+    min_views: Optional[int] = None,
+    include_tags: Optional[str] = None,
+    exclude_tags: Optional[str] = None,
+    illust_type: Optional[str] = None,
+    min_page_count: Optional[int] = None,
+    max_page_count: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    ai_generated: Optional[bool] = None,
+    sort_by: Optional[str] = None,
+    output_mode: Optional[str] = None,
+    fields: Optional[str] = None,
+    max_items: Optional[int] = None,
+    max_chars: Optional[int] = None
+) -> str:
+    """获取插画排行榜。limit/max_pages 用于自动翻页，例如 limit=100 一次获取前 100 名；筛选、排序与输出参数同 search_illust，名次保持原排行榜名次。"""
+    illust_filter, sort_by, error = build_illust_filter(min_bookmarks, min_views, include_tags, exclude_tags, illust_type,
+                                                        min_page_count, max_page_count, start_date, end_date, ai_generated, sort_by)
+    error = error or validate_output_options(output_mode, fields)
+    if error:
+        return error
+    result = await collect_illusts('illust_ranking', mode=mode, date=date, offset=offset, limit=limit, max_pages=max_pages,
+                                   illust_filter=illust_filter, sort_by=sort_by)
+    error = handle_api_error(result.response)
     if error:
         return error
 
-    illusts = json_result.get('illusts', [])
+    illusts = result.items
     if not illusts:
         return f"找不到模式为 '{mode}' 的排行榜结果。"
 
-    summary_list = [f"第 {i+1+offset} 名: {format_illust_summary(illust)}" for i, illust in enumerate(illusts)]
-    return f"{mode.capitalize()} 排行榜:\n\n" + "\n\n".join(summary_list)
+    ranks = [position + offset for position in result.positions]
+    return render_list(illusts, 'illust', format_illust_summary, f"{mode.capitalize()} 排行榜:\n\n",
+                       output_mode, fields, result, ranks=ranks, max_items=max_items, max_chars=max_chars)
 
 @mcp.tool()
-async def search_user(word: str, offset: int = 0) -> str:
-    """搜索用户。"""
-    json_result = await asyncio.to_thread(state.api.search_user, word, offset=offset)
+async def search_user(word: str, offset: int = 0, output_mode: Optional[str] = None, fields: Optional[str] = None,
+                      max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+    """搜索用户。输出参数同 search_illust。"""
+    error = validate_output_options(output_mode, fields)
+    if error:
+        return error
+    json_result = await call_api('search_user', word, offset=offset)
     error = handle_api_error(json_result)
     if error:
         return error
@@ -176,42 +317,39 @@ async def search_user(word: str, offset: int = 0) -> str:
     if not users:
         return f"抱歉，未能找到名为 '{word}' 的用户。"
         
-    summary_list = [format_user_summary(user) for user in users]
-    return f"找到 {len(users)} 位用户:\n\n" + "\n\n".join(summary_list)
+    return render_list(users, 'user', format_user_summary, f"找到 {len(users)} 位用户:\n\n", output_mode, fields, max_items=max_items, max_chars=max_chars)
 
 @mcp.tool()
-async def illust_recommended(offset: int = 0) -> str:
-    """获取官方推荐插画的文本列表。注意：此工具只返回作品信息，不执行下载。如需下载，请使用'download_random_from_recommendation'工具。支持自动token刷新。"""
-    if not state.is_authenticated:
+async def illust_recommended(offset: int = 0, output_mode: Optional[str] = None, fields: Optional[str] = None,
+                             max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+    """获取官方推荐插画的文本列表。注意：此工具只返回作品信息，不执行下载。如需下载，请使用'download_random_from_recommendation'工具。支持自动token刷新。输出参数同 search_illust。"""
+    if not await state.token_manager.ensure_valid():
         return "错误: 此功能需要认证。请先使用 auth 工具或在客户端设置 PIXIV_REFRESH_TOKEN 环境变量。"
+    error = validate_output_options(output_mode, fields)
+    if error:
+        return error
         
-    # 首次尝试API调用
-    json_result = await asyncio.to_thread(state.api.illust_recommended, offset=offset)
-    
-    # 使用新的错误处理机制，支持自动重试
-    error, retry_result = await handle_api_error_with_retry(
-        json_result, 
-        state.api.illust_recommended, 
-        offset=offset
-    )
-    
-    # 如果重试成功，使用新的结果
-    if retry_result:
-        json_result = retry_result
-    elif error:
+    # call_api 会在 token 失效时自动刷新并重试
+    json_result = await call_api('illust_recommended', offset=offset)
+    error = handle_api_error(json_result)
+    if error:
         return error
     
     illusts = json_result.get('illusts', [])
     if not illusts:
         return "暂无推荐内容。"
         
-    summary_list = [format_illust_summary(illust) for illust in illusts]
-    return f"为您推荐 {len(illusts)} 张插画:\n\n" + "\n\n".join(summary_list)
+    return render_list(illusts, 'illust', format_illust_summary, f"为您推荐 {len(illusts)} 张插画:\n\n",
+                       output_mode, fields, max_items=max_items, max_chars=max_chars)
 
 @mcp.tool()
-async def trending_tags_illust() -> str:
-    """获取当前的热门标签趋势。"""
-    json_result = await asyncio.to_thread(state.api.trending_tags_illust)
+async def trending_tags_illust(output_mode: Optional[str] = None, fields: Optional[str] = None,
+                               max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+    """获取当前的热门标签趋势。输出参数同 search_illust，字段如 tag,translated_name,illust.id。"""
+    error = validate_output_options(output_mode, fields)
+    if error:
+        return error
+    json_result = await call_api('trending_tags_illust')
     error = handle_api_error(json_result)
     if error:
         return error
@@ -220,67 +358,140 @@ async def trending_tags_illust() -> str:
     if not trend_tags:
         return "无法获取热门标签。"
         
-    tag_list = [f"- {tag.get('tag')} (翻译: {tag.get('translated_name', '无')})" for tag in trend_tags]
-    return "当前的热门标签:\n" + "\n".join(tag_list)
+    return render_list(trend_tags, 'tag', lambda tag: f"- {tag.get('tag')} (翻译: {tag.get('translated_name', '无')})",
+                       "当前的热门标签:\n", output_mode, fields, separator="\n",
+                       max_items=max_items, max_chars=max_chars)
 
 @mcp.tool()
-async def illust_follow(restrict: str = "public", offset: int = 0) -> str:
-    """获取已关注作者的最新作品（首页动态）(需要认证)。"""
-    if not state.is_authenticated:
+async def illust_follow(
+    restrict: str = "public",
+    offset: int = 0,
+    limit: Optional[int] = None,
+    max_pages: Optional[int] = None,
+    min_bookmarks: Optional[int] = None,
+    min_views: Optional[int] = None,
+    include_tags: Optional[str] = None,
+    exclude_tags: Optional[str] = None,
+    illust_type: Optional[str] = None,
+    min_page_count: Optional[int] = None,
+    max_page_count: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    ai_generated: Optional[bool] = None,
+    sort_by: Optional[str] = None,
+    output_mode: Optional[str] = None,
+    fields: Optional[str] = None,
+    max_items: Optional[int] = None,
+    max_chars: Optional[int] = None
+) -> str:
+    """获取已关注作者的最新作品（首页动态）(需要认证)。limit/max_pages 用于自动翻页，筛选、排序与输出参数同 search_illust。"""
+    if not await state.token_manager.ensure_valid():
         return "错误: 此功能需要认证。请先使用 auth 工具或在客户端设置 PIXIV_REFRESH_TOKEN 环境变量。"
         
-    json_result = await asyncio.to_thread(state.api.illust_follow, restrict=restrict, offset=offset)
-    error = handle_api_error(json_result)
+    illust_filter, sort_by, error = build_illust_filter(min_bookmarks, min_views, include_tags, exclude_tags, illust_type,
+                                                        min_page_count, max_page_count, start_date, end_date, ai_generated, sort_by)
+    error = error or validate_output_options(output_mode, fields)
+    if error:
+        return error
+    result = await collect_illusts('illust_follow', restrict=restrict, offset=offset, limit=limit, max_pages=max_pages,
+                                   illust_filter=illust_filter, sort_by=sort_by)
+    error = handle_api_error(result.response)
     if error:
         return error
     
-    illusts = json_result.get('illusts', [])
+    illusts = result.items
     if not illusts:
         return "您的关注动态中暂时没有新作品。"
         
-    summary_list = [format_illust_summary(illust) for illust in illusts]
-    return f"找到 {len(illusts)} 篇关注动态:\n\n" + "\n\n".join(summary_list)
+    return render_list(illusts, 'illust', format_illust_summary, f"找到 {len(illusts)} 篇关注动态:\n\n",
+                       output_mode, fields, result, max_items=max_items, max_chars=max_chars)
 
 @mcp.tool()
-async def user_bookmarks(user_id_to_check: Optional[int] = None, restrict: str = "public", tag: Optional[str] = None, max_bookmark_id: Optional[int] = None) -> str:
-    """获取用户的收藏列表 (需要认证)。"""
-    if not state.is_authenticated:
+async def user_bookmarks(
+    user_id_to_check: Optional[int] = None,
+    restrict: str = "public",
+    tag: Optional[str] = None,
+    max_bookmark_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    max_pages: Optional[int] = None,
+    min_bookmarks: Optional[int] = None,
+    min_views: Optional[int] = None,
+    include_tags: Optional[str] = None,
+    exclude_tags: Optional[str] = None,
+    illust_type: Optional[str] = None,
+    min_page_count: Optional[int] = None,
+    max_page_count: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    ai_generated: Optional[bool] = None,
+    sort_by: Optional[str] = None,
+    output_mode: Optional[str] = None,
+    fields: Optional[str] = None,
+    max_items: Optional[int] = None,
+    max_chars: Optional[int] = None
+) -> str:
+    """获取用户的收藏列表 (需要认证)。limit/max_pages 用于自动翻页，无需手动传递 max_bookmark_id；筛选、排序与输出参数同 search_illust。"""
+    if not await state.token_manager.ensure_valid():
         return "错误: 此功能需要认证。请先使用 auth 工具或在客户端设置 PIXIV_REFRESH_TOKEN 环境变量。"
     
     target_user_id = user_id_to_check if user_id_to_check is not None else state.user_id
     if target_user_id is None:
          return "错误: 查询自己的收藏时，需要先认证以获取用户ID。"
 
-    json_result = await asyncio.to_thread(state.api.user_bookmarks_illust, target_user_id, restrict=restrict, tag=tag, max_bookmark_id=max_bookmark_id)
-    error = handle_api_error(json_result)
+    illust_filter, sort_by, error = build_illust_filter(min_bookmarks, min_views, include_tags, exclude_tags, illust_type,
+                                                        min_page_count, max_page_count, start_date, end_date, ai_generated, sort_by)
+    error = error or validate_output_options(output_mode, fields)
+    if error:
+        return error
+    result = await collect_illusts('user_bookmarks_illust', target_user_id, restrict=restrict, tag=tag, max_bookmark_id=max_bookmark_id,
+                                   limit=limit, max_pages=max_pages, illust_filter=illust_filter, sort_by=sort_by)
+    error = handle_api_error(result.response)
     if error:
         return error
 
-    illusts = json_result.get('illusts', [])
+    illusts = result.items
     if not illusts:
         return f"找不到用户 {target_user_id} 的收藏。"
         
-    summary_list = [format_illust_summary(illust) for illust in illusts]
-    return f"找到用户 {target_user_id} 的 {len(illusts)} 个收藏:\n\n" + "\n\n".join(summary_list)
+    return render_list(illusts, 'illust', format_illust_summary, f"找到用户 {target_user_id} 的 {len(illusts)} 个收藏:\n\n",
+                       output_mode, fields, result, max_items=max_items, max_chars=max_chars)
 
 @mcp.tool()
-async def user_following(user_id_to_check: Optional[int] = None, restrict: str = "public", offset: int = 0) -> str:
-    """获取用户的关注列表 (需要认证)。"""
-    if not state.is_authenticated:
+async def user_following(user_id_to_check: Optional[int] = None, restrict: str = "public", offset: int = 0,
+                         limit: Optional[int] = None, max_pages: Optional[int] = None,
+                         output_mode: Optional[str] = None, fields: Optional[str] = None,
+                         max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+    """获取用户的关注列表 (需要认证)。limit/max_pages 用于自动翻页，输出参数同 search_illust。"""
+    if not await state.token_manager.ensure_valid():
         return "错误: 此功能需要认证。请先使用 auth 工具或在客户端设置 PIXIV_REFRESH_TOKEN 环境变量。"
     
     target_user_id = user_id_to_check if user_id_to_check is not None else state.user_id
     if target_user_id is None:
          return "错误: 查询自己的关注列表时，需要先认证以获取用户ID。"
+    error = validate_output_options(output_mode, fields)
+    if error:
+        return error
 
-    json_result = await asyncio.to_thread(state.api.user_following, target_user_id, restrict=restrict, offset=offset)
-    error = handle_api_error(json_result)
+    result = await collect_pages('user_following', target_user_id, restrict=restrict, offset=offset,
+                                 items_key='user_previews', limit=limit, max_pages=max_pages)
+    error = handle_api_error(result.response)
     if error:
         return error
     
-    users = json_result.get('user_previews', [])
+    users = result.items
     if not users:
         return f"用户 {target_user_id} 没有关注任何人。"
         
-    summary_list = [format_user_summary(user) for user in users]
-    return f"用户 {target_user_id} 关注了 {len(users)} 位用户:\n\n" + "\n\n".join(summary_list)
+    return render_list(users, 'user', format_user_summary, f"用户 {target_user_id} 关注了 {len(users)} 位用户:\n\n",
+                       output_mode, fields, result, max_items=max_items, max_chars=max_chars)
+
+@mcp.tool()
+async def continue_results(cursor: str, max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+    """获取被 max_items/max_chars 截断的上一次结果的后续部分。结果保存在服务器端，不会重新请求 Pixiv。
+
+    未指定 max_items/max_chars 时沿用原调用的预算；同一游标可重复使用，返回相同的内容。
+    """
+    text = continue_result(cursor, max_items=max_items, max_chars=max_chars)
+    if text is None:
+        return f"错误：游标 '{cursor}' 不存在或已过期，请重新调用原工具。"
+    return text
@@ -0,0 +1,213 @@
+import functools
+import importlib.util
+import io
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+import zipfile
+from fractions import Fraction
+from functools import reduce
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# 本模块会在编码进程池的子进程中导入，只能依赖标准库，不能导入 state
+logger = logging.getLogger('pixiv-mcp-server')
+
+UGOIRA_FORMATS = ('gif', 'webp', 'apng', 'mp4', 'zip')
+UGOIRA_PRESETS = ('fast', 'quality')
+UGOIRA_EXTENSIONS = {'gif': '.gif', 'webp': '.webp', 'apng': '.png', 'mp4': '.mp4', 'zip': '.zip'}
+
+# 各格式在两种预设下的 FFmpeg 输出参数
+_FFMPEG_OUTPUT_ARGS = {
+    # 使用更先进的 palettegen/paletteuse 滤镜来提高GIF质量，避免颜色失真和黑色块
+    ('gif', 'quality'): [
+        '-vf', "split[s0][s1];[s0]palettegen=stats_mode=single[p];[s1][p]paletteuse=new=1",
+        '-f', 'gif',
+    ],
+    # 全局调色板 + 有序抖动，只重绘变化区域，编码速度快得多
+    ('gif', 'fast'): [
+        '-vf', "split[s0][s1];[s0]palettegen=stats_mode=diff[p];[s1][p]paletteuse=dither=bayer:bayer_scale=5:diff_mode=rectangle",
+        '-f', 'gif',
+    ],
+    ('webp', 'quality'): ['-c:v', 'libwebp_anim', '-lossless', '0', '-quality', '90', '-compression_level', '6', '-loop', '0', '-f', 'webp'],
+    ('webp', 'fast'): ['-c:v', 'libwebp_anim', '-lossless', '0', '-quality', '75', '-compression_level', '1', '-loop', '0', '-f', 'webp'],
+    ('apng', 'quality'): ['-c:v', 'apng', '-pred', 'mixed', '-plays', '0', '-f', 'apng'],
+    ('apng', 'fast'): ['-c:v', 'apng', '-plays', '0', '-f', 'apng'],
+    # H.264 要求宽高为偶数
+    ('mp4', 'quality'): [
+        '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', '-c:v', 'libx264', '-preset', 'slow', '-crf', '18',
+        '-pix_fmt', 'yuv420p', '-movflags', '+faststart', '-f', 'mp4',
+    ],
+    ('mp4', 'fast'): [
+        '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+        '-pix_fmt', 'yuv420p', '-movflags', '+faststart', '-f', 'mp4',
+    ],
+}
+
+# Pillow 能编码的格式及其保存参数；Pillow 不支持 mp4
+_PILLOW_SAVE_ARGS = {
+    ('gif', 'quality'): {'format': 'GIF', 'optimize': True},
+    ('gif', 'fast'): {'format': 'GIF', 'optimize': False},
+    ('webp', 'quality'): {'format': 'WEBP', 'quality': 90, 'method': 6},
+    ('webp', 'fast'): {'format': 'WEBP', 'quality': 75, 'method': 0},
+    ('apng', 'quality'): {'format': 'PNG', 'optimize': True},
+    ('apng', 'fast'): {'format': 'PNG', 'optimize': False},
+}
+
+@functools.lru_cache(maxsize=None)
+def has_pillow() -> bool:
+    """检测是否安装了 Pillow（不实际导入）。"""
+    return importlib.util.find_spec('PIL') is not None
+
+def resolve_format(fmt: str, use_ffmpeg: bool, pillow_available: bool) -> str:
+    """根据可用的编码器返回实际使用的输出格式。无法编码时退回保留原始 zip。"""
+    if fmt == 'zip' or use_ffmpeg:
+        return fmt
+    if pillow_available and (fmt, 'quality') in _PILLOW_SAVE_ARGS:
+        return fmt
+    return 'zip'
+
+# 去掉为凑恒定帧率而重复写入的帧：阈值为 0 时只丢弃与前一帧完全相同的帧，被丢弃帧的时长并入前一帧
+_DEDUPE_FILTER = 'mpdecimate=hi=0:lo=0:frac=0:max=0'
+
+# image2pipe 需要显式指定帧的解码器，部分 FFmpeg 构建无法从管道中自动探测
+_FRAME_DECODERS = {'.jpg': 'mjpeg', '.jpeg': 'mjpeg', '.png': 'png', '.gif': 'gif'}
+
+def _frame_timing(frames: List[Dict]) -> Tuple[Fraction, List[int]]:
+    """根据 ugoira 元数据中每帧的 delay 计算输入帧率和每帧的重复次数。
+
+    image2pipe 只支持恒定帧率，因此取所有 delay 的最大公约数作为帧间隔，
+    较长的帧按倍数重复写入，GIF/APNG 编码前再由 _DEDUPE_FILTER 合并回一帧（见 _output_args）。
+    delay 先按 10ms（GIF 的时间精度）取整，限制重复次数。常见的等间隔动图每帧只写入一次。
+    """
+    delays = [max(10, round(frame['delay'] / 10) * 10) for frame in frames]
+    unit = reduce(math.gcd, delays)
+    return Fraction(1000, unit), [delay // unit for delay in delays]
+
+# 需要在编码前合并重复帧的格式。libwebp 会自行合并相同的连续帧并累加时长；
+# H.264 对重复帧只编码跳过块，且可变帧率下末帧时长无法保留，mp4 仍按恒定帧率输出
+_DEDUPE_FORMATS = ('gif', 'apng')
+
+def _output_args(fmt: str, preset: str, repeats: List[int], last_delay: int) -> List[str]:
+    """返回输出参数。
+
+    有重复帧的 GIF/APNG 在滤镜链最前面去重并以可变帧率输出，每帧保持原始时长，
+    而不是以最大公约数的帧率输出大量重复帧（GIF 会因此得到 1cs 的帧间隔，被浏览器按 10cs 播放）。
+    可变帧率下末帧只有一个帧间隔的时长，GIF 用 -final_delay 补足（单位 cs）。
+    """
+    args = list(_FFMPEG_OUTPUT_ARGS[(fmt, preset)])
+    if fmt not in _DEDUPE_FORMATS or all(repeat == 1 for repeat in repeats):
+        return args
+    if '-vf' in args:
+        index = args.index('-vf') + 1
+        args[index] = f"{_DEDUPE_FILTER},{args[index]}"
+    else:
+        args = ['-vf', _DEDUPE_FILTER] + args
+    if fmt == 'gif':
+        args += ['-final_delay', str(last_delay // 10)]
+    # -vsync 在新版本中已标记为过时（改为 -fps_mode），但 FFmpeg 5.1 之前只支持这一写法
+    return args + ['-vsync', 'vfr']
+
+def _convert_with_ffmpeg(zip_path: str, frames: List[Dict], part_path: str, fmt: str, preset: str):
+    """帧直接从 zip 读入内存并通过 stdin (image2pipe) 送入 FFmpeg，不解压到临时目录。"""
+    framerate, repeats = _frame_timing(frames)
+    decoder = _FRAME_DECODERS.get(os.path.splitext(frames[0]['file'])[1].lower())
+
+    cmd = [
+        'ffmpeg',
+        '-hide_banner',
+        '-loglevel', 'error',
+        '-f', 'image2pipe',
+        *(['-c:v', decoder] if decoder else []),
+        '-framerate', str(framerate),
+        '-i', 'pipe:0',
+        *_output_args(fmt, preset, repeats, int(repeats[-1] * 1000 / framerate)),
+        '-y',
+        part_path
+    ]
+
+    creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+    # -loglevel error 保证 stderr 输出很少，不会在写 stdin 时因管道写满而死锁
+    process = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        creationflags=creationflags
+    )
+    try:
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                for frame, repeat in zip(frames, repeats):
+                    data = zip_ref.read(frame['file'])
+                    for _ in range(repeat):
+                        process.stdin.write(data)
+        except BrokenPipeError:
+            # FFmpeg 提前退出，错误信息见下方 stderr
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+        stderr = process.stderr.read().decode('utf-8', errors='replace')
+        returncode = process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    except subprocess.CalledProcessError:
+        raise
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        process.stderr.close()
+
+def _convert_with_pillow(zip_path: str, frames: List[Dict], part_path: str, fmt: str, preset: str):
+    """FFmpeg 不可用时的纯 Python 编码器。Pillow 原生支持逐帧时长，无需重复帧。"""
+    from PIL import Image
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        images = [Image.open(io.BytesIO(zip_ref.read(frame['file']))) for frame in frames]
+    images[0].save(
+        part_path,
+        save_all=True,
+        append_images=images[1:],
+        duration=[frame['delay'] for frame in frames],
+        loop=0,
+        **_PILLOW_SAVE_ARGS[(fmt, preset)]
+    )
+
+def convert_ugoira(zip_path: str, frames: List[Dict], output_path: str,
+                   fmt: str = 'gif', preset: str = 'quality', use_ffmpeg: bool = True) -> str:
+    """将 Ugoira 的 zip 文件同步转换为指定格式的动画。
+
+    fmt 为 'zip' 时不编码，直接保留原始 zip 并附带记录帧时长的 .json。
+    输出先写入 .part 文件，成功后原子重命名；转换成功后删除 zip。
+    """
+    if fmt == 'zip':
+        os.replace(zip_path, output_path)
+        with open(os.path.splitext(output_path)[0] + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'frames': frames}, f, ensure_ascii=False)
+        return output_path
+
+    part_path = output_path + '.part'
+    encoder = 'FFmpeg' if use_ffmpeg else 'Pillow'
+    try:
+        if use_ffmpeg:
+            _convert_with_ffmpeg(zip_path, frames, part_path, fmt, preset)
+        else:
+            _convert_with_pillow(zip_path, frames, part_path, fmt, preset)
+        os.replace(part_path, output_path)
+        os.remove(zip_path)
+        return output_path
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFmpeg conversion failed for {Path(output_path).stem}. Exit code: {e.returncode}")
+        logger.error(f"FFmpeg stderr:\n{e.stderr}")
+        raise e
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during {fmt} conversion ({encoder}) for {Path(output_path).stem}: {e}")
+        raise e
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
@@ -1,49 +1,72 @@
-import asyncio
+import json
 import logging
+import os
 import re
+import shutil
+import time
 import subprocess
 import sys
 from typing import Optional
 
 from .state import state
+from .output import OUTPUT_MODES
+from .ugoira import UGOIRA_FORMATS, UGOIRA_PRESETS
 
 logger = logging.getLogger('pixiv-mcp-server')
 
+_ffmpeg_available: Optional[bool] = None
+
 def check_ffmpeg() -> bool:
-    """检测系统是否安装了FFmpeg"""
+    """检测系统是否安装了FFmpeg。
+
+    首次调用时才检测；结果按 FFmpeg 可执行文件的路径和修改时间缓存到数据目录，
+    FFmpeg 未变化时后续进程无需再启动子进程探测。
+    """
+    global _ffmpeg_available
+    if _ffmpeg_available is None:
+        _ffmpeg_available = _probe_ffmpeg()
+    return _ffmpeg_available
+
+def _probe_ffmpeg() -> bool:
+    path = shutil.which('ffmpeg')
+    if path is None:
+        logger.warning("未找到 FFmpeg - 动图将使用 Pillow 编码或保留为 zip")
+        return False
+
+    cache_path = os.path.join(state.data_dir, 'ffmpeg_probe.json')
+    key = {'path': path, 'mtime': os.path.getmtime(path)}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('key') == key:
+            return cached['available']
+    except (OSError, ValueError, KeyError):
+        pass
+
     try:
         creationflags = 0
         if sys.platform == 'win32':
             creationflags = subprocess.CREATE_NO_WINDOW
         
-        subprocess.run(['ffmpeg', '-version'], 
+        subprocess.run([path, '-version'], 
                      capture_output=True, check=True, creationflags=creationflags)
-        logger.info("FFmpeg 已检测 - GIF 转换功能可用")
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        logger.warning("未找到 FFmpeg - GIF 转换功能已禁用")
-        return False
+        logger.info("FFmpeg 已检测 - 动图转换功能可用")
+        available = True
+    except (subprocess.CalledProcessError, OSError):
+        logger.warning("FFmpeg 无法运行 - 动图将使用 Pillow 编码或保留为 zip")
+        available = False
 
-async def refresh_token_if_needed() -> bool:
-    """尝试刷新token，返回是否成功"""
-    if not state.refresh_token:
-        logger.error("无法刷新token：未找到refresh_token")
-        return False
-    
     try:
-        logger.info("检测到token失效，正在尝试刷新...")
-        result = await asyncio.to_thread(state.api.auth, refresh_token=state.refresh_token)
-        
-        if result and 'access_token' in result:
-            state.is_authenticated = True
-            logger.info("Token刷新成功")
-            return True
-        else:
-            logger.error(f"Token刷新失败: {result}")
-            return False
-    except Exception as e:
-        logger.error(f"Token刷新过程中发生异常: {e}")
-        return False
+        os.makedirs(state.data_dir, exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'available': available}, f)
+    except OSError as e:
+        logger.warning(f"保存 FFmpeg 检测结果失败: {e}")
+    return available
+
+async def refresh_token_if_needed() -> bool:
+    """刷新token，返回是否成功。并发调用会合并为同一次刷新请求。"""
+    return await state.token_manager.refresh()
 
 def handle_api_error(response: dict) -> Optional[str]:
     """处理来自 Pixiv API 的错误响应并格式化"""
@@ -61,47 +84,21 @@ def handle_api_error(response: dict) -> Optional[str]:
         return f"Pixiv API 错误: {msg} - {reason}".strip()
     return None
 
-async def handle_api_error_with_retry(response: dict, retry_func=None, *args, **kwargs) -> tuple[Optional[str], Optional[dict]]:
-    """处理API错误并在token失效时自动重试
-    
-    Args:
-        response: API响应
-        retry_func: 重试的函数
-        *args, **kwargs: 重试函数的参数
-    
-    Returns:
-        (error_message, new_response): 错误信息和新的响应（如果重试成功）
-    """
-    if not response:
-        return "API 响应为空。", None
-        
-    if 'error' in response:
-        error_details = response['error']
-        msg = error_details.get('message', '未知错误')
-        reason = error_details.get('reason', '')
-        
-        # 检查是否为token相关错误
-        if ('invalid_grant' in msg.lower() or 'oauth' in msg.lower() or 'unauthorized' in msg.lower()) and retry_func:
-            logger.warning(f"检测到token错误: {msg}，尝试刷新token并重试...")
-            
-            # 尝试刷新token
-            if await refresh_token_if_needed():
-                try:
-                    # 重试API调用
-                    new_response = await asyncio.to_thread(retry_func, *args, **kwargs)
-                    if new_response and 'error' not in new_response:
-                        logger.info("Token刷新后重试成功")
-                        return None, new_response
-                    else:
-                        return f"重试后仍然失败: {new_response.get('error', {}).get('message', '未知错误')}", None
-                except Exception as e:
-                    return f"重试过程中发生异常: {e}", None
-            else:
-                return f"Token刷新失败: {msg} - {reason}。请手动重新获取token。".strip(), None
-        
-        return f"Pixiv API 错误: {msg} - {reason}".strip(), None
-    
-    return None, None
+def validate_ugoira_options(ugoira_format: Optional[str], ugoira_preset: Optional[str]) -> Optional[str]:
+    """校验动图格式与预设参数，有误时返回错误信息。"""
+    if ugoira_format and ugoira_format.lower() not in UGOIRA_FORMATS:
+        return f"错误：不支持的动图格式 '{ugoira_format}'，可选: {', '.join(UGOIRA_FORMATS)}。"
+    if ugoira_preset and ugoira_preset.lower() not in UGOIRA_PRESETS:
+        return f"错误：不支持的编码预设 '{ugoira_preset}'，可选: {', '.join(UGOIRA_PRESETS)}。"
+    return None
+
+def validate_output_options(output_mode: Optional[str], fields: Optional[str]) -> Optional[str]:
+    """校验输出模式与字段列表参数，有误时返回错误信息。"""
+    if output_mode and output_mode.lower() not in OUTPUT_MODES:
+        return f"错误：不支持的输出模式 '{output_mode}'，可选: {', '.join(OUTPUT_MODES)}。"
+    if fields and not re.fullmatch(r'\s*[\w.]+(\s*,\s*[\w.]+)*\s*,?\s*', fields):
+        return "错误：fields 须为逗号分隔的字段路径，例如 id,title,user.id,total_bookmarks。"
+    return None
 
 def _sanitize_filename(name: str) -> str:
     """移除文件名中的非法字符"""
@@ -140,3 +137,118 @@ def format_user_summary(user_preview: dict) -> str:
         f"  关注状态: {'已关注' if user.get('is_followed') else '未关注'}\n"
         f"  简介: {user.get('comment', '无')}"
     )
+
+_JOB_STATUS_LABELS = {'pending': '等待中', 'running': '进行中', 'done': '已完成', 'failed': '失败', 'skipped': '已跳过'}
+_JOB_STAGE_LABELS = {'metadata': '获取元数据', 'downloading': '下载中', 'converting': '动图转换中'}
+
+def format_job_status(summary: dict) -> str:
+    """将下载任务进度汇总格式化为文本"""
+    statuses = summary['statuses']
+    counts = ", ".join(f"{label} {statuses.get(key, 0)}" for key, label in _JOB_STATUS_LABELS.items())
+    finished = sum(statuses.get(key, 0) for key in ('done', 'failed', 'skipped'))
+    elapsed = time.time() - summary['created_at']
+    lines = [
+        f"任务 {summary['job_id']}: {finished}/{summary['total_items']} 个作品已结束 (创建于 {elapsed:.0f} 秒前)",
+        f"  条目状态: {counts}",
+        f"  页面进度: {summary['pages_done']}/{summary['pages_total']}",
+        f"  已传输: {summary['bytes'] / (1024 * 1024):.2f} MB",
+        f"  最近速率: {summary['mb_per_s']:.2f} MB/s, {summary['items_per_s']:.2f} 个作品/s",
+    ]
+    for illust_id, stage in summary['running']:
+        lines.append(f"  - 作品 {illust_id}: {_JOB_STAGE_LABELS.get(stage, stage or '排队中')}")
+    if summary['errors']:
+        lines.append("  最近的错误:")
+        lines.extend(f"  - 作品 {illust_id}: {error}" for illust_id, error in summary['errors'])
+    return "\n".join(lines)
+
+def format_limiter_status(limiter, max_decisions: int = 5) -> str:
+    """将自适应并发控制器的当前上限和最近的调整记录格式化为文本"""
+    recent, baseline = limiter.latency
+    latency = f", 近期响应 {recent * 1000:.0f} ms / 基线 {baseline * 1000:.0f} ms" if recent is not None else ""
+    lines = [f"自适应并发: 上限 {limiter.limit} (范围 {limiter.min_limit}-{limiter.max_limit}), 运行中 {limiter.in_flight}{latency}"]
+    now = time.time()
+    for timestamp, old, new, reason in list(limiter.decisions)[-max_decisions:]:
+        lines.append(f"  - {now - timestamp:.0f} 秒前: {old} -> {new} ({reason})")
+    return "\n".join(lines)
+
+def format_rate_limits(rate_limiter) -> str:
+    """将各主机令牌桶的配置和累计等待情况格式化为文本"""
+    lines = ["限速:"]
+    for host, kind, rate, capacity, waits, waited in rate_limiter.snapshot():
+        if kind == 'bytes':
+            limit = f"{rate / (1024 * 1024):.1f} MB/s (突发 {capacity / (1024 * 1024):.1f} MB)"
+        else:
+            limit = f"{rate:g} 次/s (突发 {capacity:g})"
+        lines.append(f"  - {host} {limit}: 等待 {waits} 次, 共 {waited:.1f} 秒")
+    return "\n".join(lines) if len(lines) > 1 else "限速: 未启用"
+
+_RETRY_STAT_LABELS = {
+    'throttle': '限流重试', 'transient': '临时错误重试', 'auth_refresh': '刷新 token',
+    'throttle_gave_up': '限流放弃', 'transient_gave_up': '临时错误放弃', 'auth_gave_up': '认证放弃',
+}
+
+def format_retry_stats(policy) -> str:
+    """将重试策略的累计统计格式化为文本"""
+    counts = ", ".join(f"{label} {policy.stats.get(key, 0)}" for key, label in _RETRY_STAT_LABELS.items())
+    return f"重试: {counts}"
+
+def format_cache_stats(cache, store) -> str:
+    """将 API 响应缓存（内存与持久化两级）的命中统计格式化为文本"""
+    hits = sum(cache.hits.values())
+    misses = sum(cache.misses.values())
+    total = hits + misses
+    ratio = f"{hits / total:.0%}" if total else "-"
+    lines = [f"API 缓存: {len(cache)}/{cache.max_entries} 条, 命中 {hits}/{total} ({ratio}), 预填 {cache.seeded}, 淘汰 {cache.evictions}"]
+    for method in sorted(set(cache.hits) | set(cache.misses)):
+        lines.append(f"  {method}: 命中 {cache.hits[method]}, 未命中 {cache.misses[method]}")
+    if store.enabled:
+        lines.append(
+            f"持久化缓存: {store.size_bytes / 1024 / 1024:.1f}/{store.max_bytes / 1024 / 1024:.0f} MB, "
+            f"命中 {store.hits}, 未命中 {store.misses}, 淘汰 {store.evictions}"
+        )
+    return "\n".join(lines)
+
+def format_singleflight_stats(singleflight) -> str:
+    """将并发请求合并的统计格式化为文本"""
+    leaders = sum(singleflight.leaders.values())
+    deduplicated = sum(singleflight.deduplicated.values())
+    lines = [f"请求合并: 实际请求 {leaders}, 合并 {deduplicated}, 在途 {singleflight.inflight}"]
+    for method in sorted(singleflight.deduplicated):
+        lines.append(f"  {method}: 合并 {singleflight.deduplicated[method]}")
+    return "\n".join(lines)
+
+def format_executor_stats(executors) -> str:
+    """将各线程池的排队数、执行中数量和等待时间格式化为文本"""
+    lines = ["线程池:"]
+    for executor in executors:
+        lines.append(
+            f"  {executor.name}: 执行中 {executor.running}/{executor.workers}, 排队 {executor.queued}, "
+            f"已完成 {executor.completed}, 平均等待 {executor.average_wait * 1000:.1f} ms, 最长等待 {executor.max_wait * 1000:.1f} ms"
+        )
+    return "\n".join(lines)
+
+def format_loop_lag(monitor) -> str:
+    """将事件循环卡顿统计格式化为文本"""
+    if not monitor.enabled:
+        return "事件循环卡顿监测: 已关闭"
+    line = f"事件循环卡顿: {monitor.stalls} 次 (阈值 {monitor.threshold * 1000:.0f} ms), 最长 {monitor.max_lag * 1000:.0f} ms"
+    if monitor.recent:
+        last_at, last_lag = monitor.recent[-1]
+        line += f", 最近一次 {time.strftime('%H:%M:%S', time.localtime(last_at))} ({last_lag * 1000:.0f} ms)"
+    return line
+
+def format_server_status() -> str:
+    """download_status 开头的服务器整体状态：速率、动图编码、并发、限速、重试、缓存、线程池与事件循环。"""
+    mb_per_s, items_per_s = state.job_queue.meter.rates()
+    pool = state.encode_pool
+    return (
+        f"全局速率: {mb_per_s:.2f} MB/s, {items_per_s:.2f} 个作品/s\n"
+        f"动图编码: 已提交 {pool.submitted} (进程数 {pool.workers}), 等待提交 {pool.waiting}\n"
+        + format_limiter_status(state.download_limiter) + "\n"
+        + format_rate_limits(state.rate_limiter) + "\n"
+        + format_retry_stats(state.retry_policy) + "\n"
+        + format_cache_stats(state.api_cache, state.metadata_store) + "\n"
+        + format_singleflight_stats(state.singleflight) + "\n"
+        + format_executor_stats((state.metadata_executor, state.io_executor, state.cpu_executor)) + "\n"
+        + format_loop_lag(state.loop_monitor)
+    )
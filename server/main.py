@@ -7,11 +7,11 @@ This server provides browsing, searching, and downloading capabilities for Pixiv
 """
 
 import asyncio
+import importlib.util
 import json
 import logging
 import os
 import sys
-import urllib3
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
@@ -34,23 +34,28 @@ except ImportError as e:
     print("Please ensure the MCP package is installed: pip install mcp", file=sys.stderr)
     sys.exit(1)
 
-try:
-    from pixivpy3 import AppPixivAPI
-except ImportError as e:
-    print(f"Error importing pixivpy3: {e}", file=sys.stderr)
+# pixivpy3 is imported lazily on first API use; only check that it is installed
+if importlib.util.find_spec("pixivpy3") is None:
+    print("Error importing pixivpy3: No module named 'pixivpy3'", file=sys.stderr)
     print("Please ensure pixivpy3 is installed: pip install pixivpy3", file=sys.stderr)
     sys.exit(1)
 
 # Import our custom modules
 try:
+    from pixiv_mcp_server.api import call_api
+    from pixiv_mcp_server.batch import render_illust_details
+    from pixiv_mcp_server.filters import build_illust_filter, collect_illusts
+    from pixiv_mcp_server.output import continue_result, render_list, render_object
+    from pixiv_mcp_server.pagination import collect_pages
     from pixiv_mcp_server.state import state
-    from pixiv_mcp_server.downloader import _background_download_single, HAS_FFMPEG
     from pixiv_mcp_server.utils import (
         format_illust_summary,
+        format_job_status,
+        format_server_status,
         format_user_summary,
         handle_api_error,
-        handle_api_error_with_retry,
-        refresh_token_if_needed
+        validate_output_options,
+        validate_ugoira_options
     )
 except ImportError as e:
     print(f"Error importing custom modules: {e}", file=sys.stderr)
@@ -66,12 +71,69 @@ logging.basicConfig(
 )
 logger = logging.getLogger('pixiv-mcp-server')
 
-# Disable urllib3 warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 # Initialize the MCP server
 server = Server("pixiv-mcp-server")
 
+# Auto-pagination options shared by the list tools
+PAGINATION_PROPERTIES = {
+    "limit": {
+        "type": "integer",
+        "minimum": 1,
+        "description": "Collect up to this many results in one call, following next pages automatically"
+    },
+    "max_pages": {
+        "type": "integer",
+        "minimum": 1,
+        "description": "Maximum number of pages to fetch (defaults to 1, or as many as needed to reach limit)"
+    }
+}
+
+# Server-side filter and sort options shared by the illustration list tools
+FILTER_PROPERTIES = {
+    "min_bookmarks": {"type": "integer", "minimum": 0, "description": "Only keep works with at least this many bookmarks"},
+    "min_views": {"type": "integer", "minimum": 0, "description": "Only keep works with at least this many views"},
+    "include_tags": {"type": "string", "description": "Comma-separated tags that must all be present (matches original or translated names)"},
+    "exclude_tags": {"type": "string", "description": "Comma-separated tags; works carrying any of them are dropped"},
+    "illust_type": {"type": "string", "enum": ["illust", "manga", "ugoira"], "description": "Only keep works of this type"},
+    "min_page_count": {"type": "integer", "minimum": 1, "description": "Minimum number of pages"},
+    "max_page_count": {"type": "integer", "minimum": 1, "description": "Maximum number of pages"},
+    "start_date": {"type": "string", "pattern": "^\\d{4}-\\d{2}-\\d{2}$", "description": "Earliest creation date (YYYY-MM-DD, inclusive)"},
+    "end_date": {"type": "string", "pattern": "^\\d{4}-\\d{2}-\\d{2}$", "description": "Latest creation date (YYYY-MM-DD, inclusive)"},
+    "ai_generated": {"type": "boolean", "description": "true keeps only AI-generated works, false drops them"},
+    "sort_by": {
+        "type": "string",
+        "enum": ["bookmarks", "views", "date", "date_asc", "pages"],
+        "description": "Sort all scanned results server-side before applying limit"
+    }
+}
+
+# Output format options shared by the tools that return Pixiv data
+OUTPUT_PROPERTIES = {
+    "output_mode": {
+        "type": "string",
+        "enum": ["full", "compact", "json"],
+        "description": "full: readable text; compact: a header row then one line per item; json: minified JSON (defaults to OUTPUT_MODE)"
+    },
+    "fields": {
+        "type": "string",
+        "description": "Comma-separated dotted field paths to return, e.g. id,title,user.id,total_bookmarks,tags.name"
+    }
+}
+
+# Output budgets; the rest of a truncated result is kept server-side for continue_results
+BUDGET_PROPERTIES = {
+    "max_items": {
+        "type": "integer",
+        "minimum": 0,
+        "description": "Return at most this many items; the rest is available via continue_results (0 = no limit, defaults to OUTPUT_MAX_ITEMS)"
+    },
+    "max_chars": {
+        "type": "integer",
+        "minimum": 0,
+        "description": "Cap the response at about this many characters; the rest is available via continue_results (0 = no limit, defaults to OUTPUT_MAX_CHARS)"
+    }
+}
+
 # Tool definitions with proper schemas
 TOOLS = [
     Tool(
@@ -102,6 +164,16 @@ TOOLS = [
                     "type": "array",
                     "items": {"type": "integer"},
                     "description": "List of artwork IDs to download"
+                },
+                "ugoira_format": {
+                    "type": "string",
+                    "enum": ["gif", "webp", "apng", "mp4", "zip"],
+                    "description": "Output format for ugoira animations (optional, defaults to UGOIRA_FORMAT)"
+                },
+                "ugoira_preset": {
+                    "type": "string",
+                    "enum": ["fast", "quality"],
+                    "description": "Encoding preset for ugoira animations (optional, defaults to UGOIRA_PRESET)"
                 }
             },
             "anyOf": [
@@ -110,6 +182,24 @@ TOOLS = [
             ]
         }
     ),
+    Tool(
+        name="download_status",
+        description="Show download job progress: item status, pages done/total, bytes transferred, ugoira conversion stage, errors and recent MB/s and items/s.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "job_id": {
+                    "type": "string",
+                    "description": "Job ID returned by download (optional, defaults to the most recent jobs)"
+                },
+                "include_server_stats": {
+                    "type": "boolean",
+                    "description": "Also show server statistics: adaptive concurrency, rate limiting, retries, caches, thread pools and event loop stalls",
+                    "default": False
+                }
+            }
+        }
+    ),
     Tool(
         name="refresh_token",
         description="Manually refresh Pixiv API token when encountering authentication errors.",
@@ -186,7 +276,11 @@ TOOLS = [
                     "type": "boolean",
                     "default": False,
                     "description": "Include R-18 content"
-                }
+                },
+                **PAGINATION_PROPERTIES,
+                **FILTER_PROPERTIES,
+                **OUTPUT_PROPERTIES,
+                **BUDGET_PROPERTIES
             },
             "required": ["word"]
         }
@@ -200,11 +294,31 @@ TOOLS = [
                 "illust_id": {
                     "type": "integer",
                     "description": "The artwork ID"
-                }
+                },
+                **OUTPUT_PROPERTIES,
+                "max_chars": BUDGET_PROPERTIES["max_chars"]
             },
             "required": ["illust_id"]
         }
     ),
+    Tool(
+        name="illust_detail_batch",
+        description="Get details for many artworks in one call: cached ones are served locally, the rest fetched concurrently, with per-ID errors.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "illust_ids": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "minItems": 1,
+                    "description": "Artwork IDs to look up"
+                },
+                **OUTPUT_PROPERTIES,
+                **BUDGET_PROPERTIES
+            },
+            "required": ["illust_ids"]
+        }
+    ),
     Tool(
         name="illust_related",
         description="Find artworks related to a specific illustration.",
@@ -220,7 +334,11 @@ TOOLS = [
                     "default": 0,
                     "minimum": 0,
                     "description": "Pagination offset"
-                }
+                },
+                **PAGINATION_PROPERTIES,
+                **FILTER_PROPERTIES,
+                **OUTPUT_PROPERTIES,
+                **BUDGET_PROPERTIES
             },
             "required": ["illust_id"]
         }
@@ -247,7 +365,11 @@ TOOLS = [
                     "default": 0,
                     "minimum": 0,
                     "description": "Pagination offset"
-                }
+                },
+                **PAGINATION_PROPERTIES,
+                **FILTER_PROPERTIES,
+                **OUTPUT_PROPERTIES,
+                **BUDGET_PROPERTIES
             }
         }
     ),
@@ -266,7 +388,9 @@ TOOLS = [
                     "default": 0,
                     "minimum": 0,
                     "description": "Pagination offset"
-                }
+                },
+                **OUTPUT_PROPERTIES,
+                **BUDGET_PROPERTIES
             },
             "required": ["word"]
         }
@@ -282,7 +406,9 @@ TOOLS = [
                     "default": 0,
                     "minimum": 0,
                     "description": "Pagination offset"
-                }
+                },
+                **OUTPUT_PROPERTIES,
+                **BUDGET_PROPERTIES
             }
         }
     ),
@@ -291,7 +417,10 @@ TOOLS = [
         description="Get currently trending illustration tags.",
         inputSchema={
             "type": "object",
-            "properties": {},
+            "properties": {
+                **OUTPUT_PROPERTIES,
+                **BUDGET_PROPERTIES
+            },
             "additionalProperties": False
         }
     ),
@@ -312,7 +441,11 @@ TOOLS = [
                     "default": 0,
                     "minimum": 0,
                     "description": "Pagination offset"
-                }
+                },
+                **PAGINATION_PROPERTIES,
+                **FILTER_PROPERTIES,
+                **OUTPUT_PROPERTIES,
+                **BUDGET_PROPERTIES
             }
         }
     ),
@@ -339,7 +472,11 @@ TOOLS = [
                 "max_bookmark_id": {
                     "type": "integer",
                     "description": "Maximum bookmark ID for pagination"
-                }
+                },
+                **PAGINATION_PROPERTIES,
+                **FILTER_PROPERTIES,
+                **OUTPUT_PROPERTIES,
+                **BUDGET_PROPERTIES
             }
         }
     ),
@@ -364,9 +501,27 @@ TOOLS = [
                     "default": 0,
                     "minimum": 0,
                     "description": "Pagination offset"
-                }
+                },
+                **PAGINATION_PROPERTIES,
+                **OUTPUT_PROPERTIES,
+                **BUDGET_PROPERTIES
             }
         }
+    ),
+    Tool(
+        name="continue_results",
+        description="Fetch the next chunk of a result that was truncated by max_items/max_chars, without calling Pixiv again. Budgets default to those of the original call; retrying the same cursor returns the same chunk.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "cursor": {
+                    "type": "string",
+                    "description": "The cursor returned with the truncated result"
+                },
+                **BUDGET_PROPERTIES
+            },
+            "required": ["cursor"]
+        }
     )
 ]
 
@@ -382,8 +537,9 @@ async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[TextCon
         logger.info(f"Tool called: {name} with arguments: {arguments}")
         
         # Ensure authentication before API calls
-        if name not in ["set_download_path", "refresh_token", "set_refresh_token"]:
-            if not state.is_authenticated:
+        if name not in ["set_download_path", "download_status", "refresh_token", "set_refresh_token", "continue_results"]:
+            # token 有效时不发起请求；即将过期或尚未认证时等待一次共享的刷新
+            if not await state.token_manager.ensure_valid():
                 return [TextContent(
                     type="text",
                     text="错误：未认证。请先使用 set_refresh_token 工具设置 refresh token，或使用 refresh_token 工具进行认证。"
@@ -395,7 +551,14 @@ async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[TextCon
         elif name == "download":
             result = await tool_download(
                 arguments.get("illust_id"),
-                arguments.get("illust_ids")
+                arguments.get("illust_ids"),
+                arguments.get("ugoira_format"),
+                arguments.get("ugoira_preset")
+            )
+        elif name == "download_status":
+            result = await tool_download_status(
+                arguments.get("job_id"),
+                arguments.get("include_server_stats", False)
             )
         elif name == "refresh_token":
             result = await tool_refresh_token()
@@ -412,49 +575,122 @@ async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[TextCon
                 arguments.get("sort", "date_desc"),
                 arguments.get("duration"),
                 arguments.get("offset", 0),
-                arguments.get("search_r18", False)
+                arguments.get("search_r18", False),
+                arguments.get("limit"),
+                arguments.get("max_pages"),
+                filter_arguments(arguments),
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_items"),
+                arguments.get("max_chars")
             )
         elif name == "illust_detail":
-            result = await tool_illust_detail(arguments["illust_id"])
+            result = await tool_illust_detail(
+                arguments["illust_id"],
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_chars")
+            )
+        elif name == "illust_detail_batch":
+            result = await tool_illust_detail_batch(
+                arguments["illust_ids"],
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_items"),
+                arguments.get("max_chars")
+            )
         elif name == "illust_related":
             result = await tool_illust_related(
                 arguments["illust_id"],
-                arguments.get("offset", 0)
+                arguments.get("offset", 0),
+                arguments.get("limit"),
+                arguments.get("max_pages"),
+                filter_arguments(arguments),
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_items"),
+                arguments.get("max_chars")
             )
         elif name == "illust_ranking":
             result = await tool_illust_ranking(
                 arguments.get("mode", "day"),
                 arguments.get("date"),
-                arguments.get("offset", 0)
+                arguments.get("offset", 0),
+                arguments.get("limit"),
+                arguments.get("max_pages"),
+                filter_arguments(arguments),
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_items"),
+                arguments.get("max_chars")
             )
         elif name == "search_user":
             result = await tool_search_user(
                 arguments["word"],
-                arguments.get("offset", 0)
+                arguments.get("offset", 0),
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_items"),
+                arguments.get("max_chars")
             )
         elif name == "illust_recommended":
             result = await tool_illust_recommended(
-                arguments.get("offset", 0)
+                arguments.get("offset", 0),
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_items"),
+                arguments.get("max_chars")
             )
         elif name == "trending_tags_illust":
-            result = await tool_trending_tags_illust()
+            result = await tool_trending_tags_illust(
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_items"),
+                arguments.get("max_chars")
+            )
         elif name == "illust_follow":
             result = await tool_illust_follow(
                 arguments.get("restrict", "public"),
-                arguments.get("offset", 0)
+                arguments.get("offset", 0),
+                arguments.get("limit"),
+                arguments.get("max_pages"),
+                filter_arguments(arguments),
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_items"),
+                arguments.get("max_chars")
             )
         elif name == "user_bookmarks":
             result = await tool_user_bookmarks(
                 arguments.get("user_id_to_check"),
                 arguments.get("restrict", "public"),
                 arguments.get("tag"),
-                arguments.get("max_bookmark_id")
+                arguments.get("max_bookmark_id"),
+                arguments.get("limit"),
+                arguments.get("max_pages"),
+                filter_arguments(arguments),
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_items"),
+                arguments.get("max_chars")
             )
         elif name == "user_following":
             result = await tool_user_following(
                 arguments.get("user_id_to_check"),
                 arguments.get("restrict", "public"),
-                arguments.get("offset", 0)
+                arguments.get("offset", 0),
+                arguments.get("limit"),
+                arguments.get("max_pages"),
+                arguments.get("output_mode"),
+                arguments.get("fields"),
+                arguments.get("max_items"),
+                arguments.get("max_chars")
+            )
+        elif name == "continue_results":
+            result = await tool_continue_results(
+                arguments["cursor"],
+                arguments.get("max_items"),
+                arguments.get("max_chars")
             )
         else:
             result = f"错误：未知工具 '{name}'"
@@ -480,10 +716,14 @@ async def tool_set_download_path(path: str) -> str:
         logger.error(f"设置下载路径失败: {e}")
         return f"错误：无法设置下载路径。请检查路径 '{path}' 是否有效且程序有写入权限。错误详情: {e}"
 
-async def tool_download(illust_id: Optional[int] = None, illust_ids: Optional[List[int]] = None) -> str:
+async def tool_download(illust_id: Optional[int] = None, illust_ids: Optional[List[int]] = None,
+                        ugoira_format: Optional[str] = None, ugoira_preset: Optional[str] = None) -> str:
     """Download tool implementation."""
     if not illust_id and not illust_ids:
         return "错误：必须提供 illust_id (单个ID) 或 illust_ids (ID列表) 参数之一。"
+    error = validate_ugoira_options(ugoira_format, ugoira_preset)
+    if error:
+        return error
 
     id_list = []
     if illust_id:
@@ -493,10 +733,28 @@ async def tool_download(illust_id: Optional[int] = None, illust_ids: Optional[Li
     
     unique_ids = sorted(list(set(id_list)))
     
-    for an_id in unique_ids:
-        asyncio.create_task(_background_download_single(an_id))
+    job_id, _ = await state.job_queue.enqueue(
+        unique_ids, state.download_path,
+        ugoira_format.lower() if ugoira_format else None,
+        ugoira_preset.lower() if ugoira_preset else None
+    )
+    
+    return f"已成功将 {len(unique_ids)} 个作品的下载任务派发至后台（任务ID: {job_id}）。可使用 download_status 工具查询进度。请注意，动图(Ugoira)合成可能需要几十秒到数分钟，请耐心等待文件下载和处理完成。"
+
+async def tool_download_status(job_id: Optional[str] = None, include_server_stats: bool = False) -> str:
+    """Download status tool implementation."""
+    job_ids = [job_id] if job_id else await state.job_queue.recent_job_ids()
+    reports = [format_server_status()] if include_server_stats else []
+    if not job_ids:
+        reports.append("暂无下载任务。")
+    for an_id in job_ids:
+        summary = await state.job_queue.status(an_id)
+        if summary is None:
+            reports.append(f"找不到任务 {an_id}。")
+        else:
+            reports.append(format_job_status(summary))
     
-    return f"已成功将 {len(unique_ids)} 个作品的下载任务派发至后台。请注意，动图(Ugoira)合成可能需要几十秒到数分钟，请耐心等待文件下载和处理完成。"
+    return "\n\n".join(reports)
 
 async def tool_refresh_token() -> str:
     """Refresh token tool implementation."""
@@ -504,9 +762,8 @@ async def tool_refresh_token() -> str:
         if not state.refresh_token:
             return "错误：未设置 refresh token。请先使用 set_refresh_token 工具设置 token。"
         
-        state.api.auth(refresh_token=state.refresh_token)
-        state.is_authenticated = True
-        state.user_id = state.api.user_id
+        if not await state.token_manager.refresh():
+            return "认证失败，请检查 refresh token 是否有效以及网络/代理设置，详情见日志。"
         return f"认证成功！用户 ID: {state.user_id}"
     except Exception as e:
         logger.error(f"Token 刷新失败: {e}")
@@ -522,9 +779,8 @@ async def tool_set_refresh_token(refresh_token: str) -> str:
         state.refresh_token = refresh_token.strip()
         
         # Try to authenticate immediately
-        state.api.auth(refresh_token=state.refresh_token)
-        state.is_authenticated = True
-        state.user_id = state.api.user_id
+        if not await state.token_manager.refresh():
+            return "⚠️ Refresh token 已保存，但认证失败，详情见日志。\n\n请检查 token 是否有效，或稍后使用 refresh_token 工具重试认证。"
         
         return f"✅ Refresh token 设置成功并已完成认证！\n用户 ID: {state.user_id}\n\n现在您可以使用所有 Pixiv 功能了。"
     except Exception as e:
@@ -535,132 +791,167 @@ async def tool_set_refresh_token(refresh_token: str) -> str:
 async def tool_download_random_from_recommendation(count: int = 5) -> str:
     """Download random from recommendation tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
-        json_result = state.api.illust_recommended()
+        json_result = await call_api('illust_recommended')
+        error = handle_api_error(json_result)
+        if error:
+            return f"获取推荐列表失败: {error}"
         if 'illusts' not in json_result or not json_result['illusts']:
             return "无法获取推荐内容，可能是网络问题或需要重新认证。"
         
         illusts = json_result['illusts']
         selected_illusts = illusts[:min(count, len(illusts))]
         
-        for illust in selected_illusts:
-            asyncio.create_task(_background_download_single(illust['id']))
+        job_id, _ = await state.job_queue.enqueue([illust['id'] for illust in selected_illusts], state.download_path)
         
         summary = "\n".join([format_illust_summary(illust) for illust in selected_illusts])
-        return f"已从推荐中选择 {len(selected_illusts)} 个作品进行下载：\n\n{summary}\n\n下载任务已派发至后台。"
+        return f"已从推荐中选择 {len(selected_illusts)} 个作品进行下载：\n\n{summary}\n\n下载任务已派发至后台（任务ID: {job_id}）。"
         
     except Exception as e:
-        return await handle_api_error(e, "获取推荐内容")
+        logger.error(f"获取推荐内容失败: {e}")
+        return f"获取推荐内容失败: {e}"
+
+def filter_arguments(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick the filter/sort options out of the tool arguments."""
+    return {key: arguments[key] for key in FILTER_PROPERTIES if arguments.get(key) is not None}
 
 async def tool_search_illust(word: str, search_target: str = "partial_match_for_tags", 
                            sort: str = "date_desc", duration: Optional[str] = None, 
-                           offset: int = 0, search_r18: bool = False) -> str:
+                           offset: int = 0, search_r18: bool = False,
+                           limit: Optional[int] = None, max_pages: Optional[int] = None,
+                           filters: Optional[Dict[str, Any]] = None,
+                           output_mode: Optional[str] = None, fields: Optional[str] = None,
+                           max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """Search illust tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
-        json_result = await handle_api_error_with_retry(
-            lambda: state.api.search_illust(
-                word=word,
-                search_target=search_target,
-                sort=sort,
-                duration=duration,
-                offset=offset
-            ),
-            f"搜索插画 '{word}'"
+        # Filter R-18 content if not requested
+        illust_filter, sort_by, error = build_illust_filter(**(filters or {}), exclude_r18=not search_r18)
+        error = error or validate_output_options(output_mode, fields)
+        if error:
+            return error
+        result = await collect_illusts(
+            'search_illust',
+            word=word,
+            search_target=search_target,
+            sort=sort,
+            duration=duration,
+            offset=offset,
+            limit=limit,
+            max_pages=max_pages,
+            illust_filter=illust_filter,
+            sort_by=sort_by
         )
         
-        if not json_result or 'illusts' not in json_result:
+        if not result.response or 'illusts' not in result.response:
             return f"搜索 '{word}' 未找到结果。"
         
-        illusts = json_result['illusts']
+        illusts = result.items
         if not illusts:
             return f"搜索 '{word}' 未找到结果。"
         
-        # Filter R-18 content if not requested
-        if not search_r18:
-            illusts = [illust for illust in illusts if illust.get('x_restrict', 0) == 0]
-        
-        summary = "\n".join([format_illust_summary(illust) for illust in illusts[:10]])
-        return f"搜索 '{word}' 找到 {len(illusts)} 个结果（显示前10个）：\n\n{summary}"
+        return render_list(illusts, 'illust', format_illust_summary, f"搜索 '{word}' 找到 {len(illusts)} 个结果：\n\n",
+                           output_mode, fields, result, separator="\n",
+                           max_items=max_items, max_chars=max_chars)
         
     except Exception as e:
-        return await handle_api_error(e, f"搜索插画 '{word}'")
+        logger.error(f"搜索插画 '{word}'失败: {e}")
+        return f"搜索插画 '{word}'失败: {e}"
 
-async def tool_illust_detail(illust_id: int) -> str:
+async def tool_illust_detail(illust_id: int, output_mode: Optional[str] = None, fields: Optional[str] = None,
+                             max_chars: Optional[int] = None) -> str:
     """Illust detail tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
-        json_result = await handle_api_error_with_retry(
-            lambda: state.api.illust_detail(illust_id),
-            f"获取作品详情 {illust_id}"
-        )
+        error = validate_output_options(output_mode, fields)
+        if error:
+            return error
+        json_result = await call_api('illust_detail', illust_id)
         
         if not json_result or 'illust' not in json_result:
             return f"无法获取作品 {illust_id} 的详细信息。"
         
-        return format_illust_summary(json_result['illust'], detailed=True)
+        return render_object(json_result['illust'], 'illust_detail',
+                             lambda illust: json.dumps(illust, ensure_ascii=False, indent=2), output_mode, fields,
+                             max_chars=max_chars)
         
     except Exception as e:
-        return await handle_api_error(e, f"获取作品详情 {illust_id}")
+        logger.error(f"获取作品详情 {illust_id}失败: {e}")
+        return f"获取作品详情 {illust_id}失败: {e}"
 
-async def tool_illust_related(illust_id: int, offset: int = 0) -> str:
+async def tool_illust_detail_batch(illust_ids: List[int], output_mode: Optional[str] = None, fields: Optional[str] = None,
+                                   max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+    """Batch illust detail tool implementation."""
+    try:
+        return await render_illust_details(illust_ids, output_mode, fields, max_items, max_chars, separator="\n")
+    except Exception as e:
+        logger.error(f"批量获取作品详情失败: {e}")
+        return f"批量获取作品详情失败: {e}"
+
+async def tool_illust_related(illust_id: int, offset: int = 0,
+                              limit: Optional[int] = None, max_pages: Optional[int] = None,
+                              filters: Optional[Dict[str, Any]] = None,
+                              output_mode: Optional[str] = None, fields: Optional[str] = None,
+                              max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """Illust related tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
-        json_result = await handle_api_error_with_retry(
-            lambda: state.api.illust_related(illust_id, offset=offset),
-            f"获取相关作品 {illust_id}"
-        )
-        
-        if not json_result or 'illusts' not in json_result:
+        illust_filter, sort_by, error = build_illust_filter(**(filters or {}))
+        error = error or validate_output_options(output_mode, fields)
+        if error:
+            return error
+        result = await collect_illusts('illust_related', illust_id, offset=offset, limit=limit, max_pages=max_pages,
+                                       illust_filter=illust_filter, sort_by=sort_by)
+        
+        if not result.response or 'illusts' not in result.response:
             return f"无法获取作品 {illust_id} 的相关作品。"
         
-        illusts = json_result['illusts']
+        illusts = result.items
         if not illusts:
             return f"作品 {illust_id} 没有找到相关作品。"
         
-        summary = "\n".join([format_illust_summary(illust) for illust in illusts[:10]])
-        return f"作品 {illust_id} 的相关作品（显示前10个）：\n\n{summary}"
+        return render_list(illusts, 'illust', format_illust_summary, f"作品 {illust_id} 的相关作品（共 {len(illusts)} 个）：\n\n",
+                           output_mode, fields, result, separator="\n",
+                           max_items=max_items, max_chars=max_chars)
         
     except Exception as e:
-        return await handle_api_error(e, f"获取相关作品 {illust_id}")
+        logger.error(f"获取相关作品 {illust_id}失败: {e}")
+        return f"获取相关作品 {illust_id}失败: {e}"
 
-async def tool_illust_ranking(mode: str = "day", date: Optional[str] = None, offset: int = 0) -> str:
+async def tool_illust_ranking(mode: str = "day", date: Optional[str] = None, offset: int = 0,
+                              limit: Optional[int] = None, max_pages: Optional[int] = None,
+                              filters: Optional[Dict[str, Any]] = None,
+                              output_mode: Optional[str] = None, fields: Optional[str] = None,
+                              max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """Illust ranking tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
-        json_result = await handle_api_error_with_retry(
-            lambda: state.api.illust_ranking(mode=mode, date=date, offset=offset),
-            f"获取排行榜 {mode}"
-        )
-        
-        if not json_result or 'illusts' not in json_result:
+        illust_filter, sort_by, error = build_illust_filter(**(filters or {}))
+        error = error or validate_output_options(output_mode, fields)
+        if error:
+            return error
+        result = await collect_illusts('illust_ranking', mode=mode, date=date, offset=offset, limit=limit, max_pages=max_pages,
+                                       illust_filter=illust_filter, sort_by=sort_by)
+        
+        if not result.response or 'illusts' not in result.response:
             return f"无法获取 {mode} 排行榜。"
         
-        illusts = json_result['illusts']
+        illusts = result.items
         if not illusts:
             return f"{mode} 排行榜暂无内容。"
         
-        summary = "\n".join([format_illust_summary(illust) for illust in illusts[:10]])
-        return f"{mode} 排行榜（显示前10个）：\n\n{summary}"
+        return render_list(illusts, 'illust', format_illust_summary, f"{mode} 排行榜（共 {len(illusts)} 个）：\n\n",
+                           output_mode, fields, result, separator="\n",
+                           max_items=max_items, max_chars=max_chars)
         
     except Exception as e:
-        return await handle_api_error(e, f"获取排行榜 {mode}")
+        logger.error(f"获取排行榜 {mode}失败: {e}")
+        return f"获取排行榜 {mode}失败: {e}"
 
-async def tool_search_user(word: str, offset: int = 0) -> str:
+async def tool_search_user(word: str, offset: int = 0,
+                           output_mode: Optional[str] = None, fields: Optional[str] = None,
+                           max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """Search user tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
-        json_result = await handle_api_error_with_retry(
-            lambda: state.api.search_user(word, offset=offset),
-            f"搜索用户 '{word}'"
-        )
+        error = validate_output_options(output_mode, fields)
+        if error:
+            return error
+        json_result = await call_api('search_user', word, offset=offset)
         
         if not json_result or 'user_previews' not in json_result:
             return f"搜索用户 '{word}' 未找到结果。"
@@ -669,21 +960,22 @@ async def tool_search_user(word: str, offset: int = 0) -> str:
         if not users:
             return f"搜索用户 '{word}' 未找到结果。"
         
-        summary = "\n".join([format_user_summary(user['user']) for user in users[:10]])
-        return f"搜索用户 '{word}' 找到 {len(users)} 个结果（显示前10个）：\n\n{summary}"
+        return render_list(users, 'user', format_user_summary, f"搜索用户 '{word}' 找到 {len(users)} 个结果：\n\n",
+                           output_mode, fields, separator="\n",
+                           max_items=max_items, max_chars=max_chars)
         
     except Exception as e:
-        return await handle_api_error(e, f"搜索用户 '{word}'")
+        logger.error(f"搜索用户 '{word}'失败: {e}")
+        return f"搜索用户 '{word}'失败: {e}"
 
-async def tool_illust_recommended(offset: int = 0) -> str:
+async def tool_illust_recommended(offset: int = 0, output_mode: Optional[str] = None, fields: Optional[str] = None,
+                                  max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """Illust recommended tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
-        json_result = await handle_api_error_with_retry(
-            lambda: state.api.illust_recommended(offset=offset),
-            "获取推荐作品"
-        )
+        error = validate_output_options(output_mode, fields)
+        if error:
+            return error
+        json_result = await call_api('illust_recommended', offset=offset)
         
         if not json_result or 'illusts' not in json_result:
             return "无法获取推荐作品。"
@@ -692,21 +984,30 @@ async def tool_illust_recommended(offset: int = 0) -> str:
         if not illusts:
             return "暂无推荐作品。"
         
-        summary = "\n".join([format_illust_summary(illust) for illust in illusts[:10]])
-        return f"推荐作品（显示前10个）：\n\n{summary}"
+        return render_list(illusts, 'illust', format_illust_summary, f"推荐作品（共 {len(illusts)} 个）：\n\n",
+                           output_mode, fields, separator="\n",
+                           max_items=max_items, max_chars=max_chars)
         
     except Exception as e:
-        return await handle_api_error(e, "获取推荐作品")
+        logger.error(f"获取推荐作品失败: {e}")
+        return f"获取推荐作品失败: {e}"
+
+def format_trending_tag(tag_info: Dict[str, Any]) -> str:
+    """Render a trending tag with its translation when it differs."""
+    tag = tag_info.get('tag', '')
+    translated_name = tag_info.get('translated_name', '')
+    if translated_name and translated_name != tag:
+        return f"{tag} ({translated_name})"
+    return tag
 
-async def tool_trending_tags_illust() -> str:
+async def tool_trending_tags_illust(output_mode: Optional[str] = None, fields: Optional[str] = None,
+                                    max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """Trending tags illust tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
-        json_result = await handle_api_error_with_retry(
-            lambda: state.api.trending_tags_illust(),
-            "获取热门标签"
-        )
+        error = validate_output_options(output_mode, fields)
+        if error:
+            return error
+        json_result = await call_api('trending_tags_illust')
         
         if not json_result or 'trend_tags' not in json_result:
             return "无法获取热门标签。"
@@ -715,100 +1016,113 @@ async def tool_trending_tags_illust() -> str:
         if not tags:
             return "暂无热门标签。"
         
-        tag_list = []
-        for tag_info in tags[:20]:
-            tag = tag_info.get('tag', '')
-            translated_name = tag_info.get('translated_name', '')
-            if translated_name and translated_name != tag:
-                tag_list.append(f"{tag} ({translated_name})")
-            else:
-                tag_list.append(tag)
-        
-        return f"当前热门标签：\n\n{', '.join(tag_list)}"
+        return render_list(tags, 'tag', format_trending_tag, "当前热门标签：\n\n", output_mode, fields, separator=", ",
+                           max_items=max_items, max_chars=max_chars)
         
     except Exception as e:
-        return await handle_api_error(e, "获取热门标签")
+        logger.error(f"获取热门标签失败: {e}")
+        return f"获取热门标签失败: {e}"
 
-async def tool_illust_follow(restrict: str = "public", offset: int = 0) -> str:
+async def tool_illust_follow(restrict: str = "public", offset: int = 0,
+                             limit: Optional[int] = None, max_pages: Optional[int] = None,
+                             filters: Optional[Dict[str, Any]] = None,
+                             output_mode: Optional[str] = None, fields: Optional[str] = None,
+                             max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """Illust follow tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
-        json_result = await handle_api_error_with_retry(
-            lambda: state.api.illust_follow(restrict=restrict, offset=offset),
-            "获取关注动态"
-        )
-        
-        if not json_result or 'illusts' not in json_result:
+        illust_filter, sort_by, error = build_illust_filter(**(filters or {}))
+        error = error or validate_output_options(output_mode, fields)
+        if error:
+            return error
+        result = await collect_illusts('illust_follow', restrict=restrict, offset=offset, limit=limit, max_pages=max_pages,
+                                       illust_filter=illust_filter, sort_by=sort_by)
+        
+        if not result.response or 'illusts' not in result.response:
             return "无法获取关注动态。"
         
-        illusts = json_result['illusts']
+        illusts = result.items
         if not illusts:
             return "暂无关注动态。"
         
-        summary = "\n".join([format_illust_summary(illust) for illust in illusts[:10]])
-        return f"关注动态（显示前10个）：\n\n{summary}"
+        return render_list(illusts, 'illust', format_illust_summary, f"关注动态（共 {len(illusts)} 个）：\n\n",
+                           output_mode, fields, result, separator="\n",
+                           max_items=max_items, max_chars=max_chars)
         
     except Exception as e:
-        return await handle_api_error(e, "获取关注动态")
+        logger.error(f"获取关注动态失败: {e}")
+        return f"获取关注动态失败: {e}"
 
 async def tool_user_bookmarks(user_id_to_check: Optional[int] = None, restrict: str = "public", 
-                            tag: Optional[str] = None, max_bookmark_id: Optional[int] = None) -> str:
+                            tag: Optional[str] = None, max_bookmark_id: Optional[int] = None,
+                            limit: Optional[int] = None, max_pages: Optional[int] = None,
+                            filters: Optional[Dict[str, Any]] = None,
+                            output_mode: Optional[str] = None, fields: Optional[str] = None,
+                            max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """User bookmarks tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
         user_id = user_id_to_check or state.user_id
         if not user_id:
             return "错误：无法确定用户ID。请先认证或提供 user_id_to_check 参数。"
         
-        json_result = await handle_api_error_with_retry(
-            lambda: state.api.user_bookmarks_illust(
-                user_id, restrict=restrict, tag=tag, max_bookmark_id=max_bookmark_id
-            ),
-            f"获取用户 {user_id} 的收藏"
-        )
+        illust_filter, sort_by, error = build_illust_filter(**(filters or {}))
+        error = error or validate_output_options(output_mode, fields)
+        if error:
+            return error
+        result = await collect_illusts('user_bookmarks_illust', user_id, restrict=restrict, tag=tag, max_bookmark_id=max_bookmark_id,
+                                       limit=limit, max_pages=max_pages, illust_filter=illust_filter, sort_by=sort_by)
         
-        if not json_result or 'illusts' not in json_result:
+        if not result.response or 'illusts' not in result.response:
             return f"无法获取用户 {user_id} 的收藏。"
         
-        illusts = json_result['illusts']
+        illusts = result.items
         if not illusts:
             return f"用户 {user_id} 暂无收藏作品。"
         
-        summary = "\n".join([format_illust_summary(illust) for illust in illusts[:10]])
-        return f"用户 {user_id} 的收藏（显示前10个）：\n\n{summary}"
+        return render_list(illusts, 'illust', format_illust_summary, f"用户 {user_id} 的收藏（共 {len(illusts)} 个）：\n\n",
+                           output_mode, fields, result, separator="\n",
+                           max_items=max_items, max_chars=max_chars)
         
     except Exception as e:
-        return await handle_api_error(e, f"获取用户收藏")
+        logger.error(f"获取用户收藏失败: {e}")
+        return f"获取用户收藏失败: {e}"
 
 async def tool_user_following(user_id_to_check: Optional[int] = None, restrict: str = "public", 
-                            offset: int = 0) -> str:
+                            offset: int = 0, limit: Optional[int] = None, max_pages: Optional[int] = None,
+                            output_mode: Optional[str] = None, fields: Optional[str] = None,
+                            max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """User following tool implementation."""
     try:
-        await refresh_token_if_needed()
-        
+        error = validate_output_options(output_mode, fields)
+        if error:
+            return error
         user_id = user_id_to_check or state.user_id
         if not user_id:
             return "错误：无法确定用户ID。请先认证或提供 user_id_to_check 参数。"
         
-        json_result = await handle_api_error_with_retry(
-            lambda: state.api.user_following(user_id, restrict=restrict, offset=offset),
-            f"获取用户 {user_id} 的关注列表"
-        )
+        result = await collect_pages('user_following', user_id, restrict=restrict, offset=offset,
+                                     items_key='user_previews', limit=limit, max_pages=max_pages)
         
-        if not json_result or 'user_previews' not in json_result:
+        if not result.response or 'user_previews' not in result.response:
             return f"无法获取用户 {user_id} 的关注列表。"
         
-        users = json_result['user_previews']
+        users = result.items
         if not users:
             return f"用户 {user_id} 暂无关注的用户。"
         
-        summary = "\n".join([format_user_summary(user['user']) for user in users[:10]])
-        return f"用户 {user_id} 的关注列表（显示前10个）：\n\n{summary}"
+        return render_list(users, 'user', format_user_summary, f"用户 {user_id} 的关注列表（共 {len(users)} 个）：\n\n",
+                           output_mode, fields, result, separator="\n",
+                           max_items=max_items, max_chars=max_chars)
         
     except Exception as e:
-        return await handle_api_error(e, f"获取用户关注列表")
+        logger.error(f"获取用户关注列表失败: {e}")
+        return f"获取用户关注列表失败: {e}"
+
+async def tool_continue_results(cursor: str, max_items: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+    """Continue results tool implementation."""
+    text = continue_result(cursor, max_items=max_items, max_chars=max_chars)
+    if text is None:
+        return f"错误：游标 '{cursor}' 不存在或已过期，请重新调用原工具。"
+    return text
 
 def setup_environment():
     """Setup environment variables and configuration."""
@@ -833,37 +1147,48 @@ async def main():
         logger.info("Pixiv MCP Server (DXT) starting...")
         logger.info(f"Default download path: {state.download_path}")
         logger.info(f"Filename template: {state.filename_template}")
-        logger.info(f"FFmpeg support: {'Yes' if HAS_FFMPEG else 'No'}")
         
-        # Auto-authenticate if refresh token is available
+        # Reuse a still-valid cached access token; otherwise authenticate lazily on the first tool call
         if state.refresh_token:
-            logger.info("Attempting auto-authentication with PIXIV_REFRESH_TOKEN...")
-            try:
-                state.api.auth(refresh_token=state.refresh_token)
-                state.is_authenticated = True
-                state.user_id = state.api.user_id
-                logger.info(f"Auto-authentication successful, user ID: {state.user_id}")
-            except Exception as e:
-                logger.warning(f"Auto-authentication failed: {e}")
-                logger.warning("Please check your REFRESH_TOKEN validity or network/proxy settings.")
+            if state.token_manager.load_cached():
+                logger.info(f"Reusing cached access token, user ID: {state.user_id}")
+            else:
+                logger.info("Authentication with PIXIV_REFRESH_TOKEN deferred to the first tool call.")
         else:
             logger.info("No PIXIV_REFRESH_TOKEN found, manual authentication required.")
         
-        # Run the MCP server
-        async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-            await server.run(
-                read_stream,
-                write_stream,
-                InitializationOptions(
-                    server_name="pixiv-mcp-server",
-                    server_version="2.0.0",
-                    capabilities=server.get_capabilities(
-                        notification_options=NotificationOptions(),
-                        experimental_capabilities={},
+        # Start proactive token refresh and download queue workers (resumes unfinished items from the last run)
+        await state.token_manager.start()
+        await state.loop_monitor.start()
+        await state.job_queue.start()
+        
+        try:
+            # Run the MCP server
+            async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
+                await server.run(
+                    read_stream,
+                    write_stream,
+                    InitializationOptions(
+                        server_name="pixiv-mcp-server",
+                        server_version="2.0.0",
+                        capabilities=server.get_capabilities(
+                            notification_options=NotificationOptions(),
+                            experimental_capabilities={},
+                        ),
                     ),
-                ),
-            )
-            
+                )
+        finally:
+            # Release resources even when the server exits with an error
+            await state.job_queue.stop()
+            await state.token_manager.stop()
+            await state.loop_monitor.stop()
+            await state.http.close()
+            state.encode_pool.shutdown()
+            for executor in (state.metadata_executor, state.io_executor, state.cpu_executor):
+                executor.shutdown()
+            state.download_index.close()
+            state.metadata_store.close()
+
     except Exception as e:
         logger.error(f"Server error: {e}", exc_info=True)
         sys.exit(1)
@@ -16,7 +16,8 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent))
 
 from pixiv_mcp_server.state import state
-from pixiv_mcp_server.utils import refresh_token_if_needed, handle_api_error_with_retry
+from pixiv_mcp_server.api import call_api
+from pixiv_mcp_server.utils import handle_api_error, refresh_token_if_needed
 
 # 设置日志
 logging.basicConfig(
@@ -75,20 +76,14 @@ async def test_token_refresh():
     print("在正常情况下，应该直接返回成功结果")
     
     try:
-        # 模拟API调用
-        result = await asyncio.to_thread(state.api.illust_recommended, offset=0)
-        error, retry_result = await handle_api_error_with_retry(
-            result,
-            state.api.illust_recommended,
-            offset=0
-        )
+        # call_api 内部会在 token 失效时刷新并重试
+        result = await call_api('illust_recommended', offset=0)
+        error = handle_api_error(result)
         
-        if retry_result:
-            print("✅ 自动重试机制工作正常（使用了重试结果）")
-        elif error:
+        if error:
             print(f"❌ 自动重试机制检测到错误: {error}")
         else:
-            print("✅ 自动重试机制工作正常（无需重试）")
+            print("✅ 自动重试机制工作正常")
             
     except Exception as e:
         print(f"❌ 自动重试机制测试失败: {e}")
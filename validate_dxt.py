@@ -48,7 +48,7 @@ def validate_manifest():
             print("❌ No tools defined")
             return False
         
-        expected_tools = 15
+        expected_tools = 18
         if len(tools) != expected_tools:
             print(f"⚠️  Expected {expected_tools} tools, found {len(tools)}")
         